@@ -0,0 +1,228 @@
+"""Benchmark inference, planning and KB queries at growing input sizes.
+
+Results are saved as JSON and compared against a stored baseline:
+
+    python benchmarks.py --save-baseline      # record a baseline
+    python benchmarks.py                      # compare against it
+
+Every input is built from a fixed seed, so runs on the same machine are
+comparable. The exit status is 1 when a benchmark regressed.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from typing import Callable, Dict, Iterator, List, Tuple
+
+from consts import Property
+from inference.bayesian import (
+    BayesianNetwork,
+    BayesianNetworkNode,
+    ConditionalProbabilityTable,
+    Variable,
+    enumeration_ask,
+)
+from player import LogicAIPlayer, ProbabilisticAIPlayer
+from utils import DistanceFieldPlanner, Point, ShortestPathSearchProblem, a_star_route
+from wumpus import WumpusWorld, generate_worlds
+
+SEED = 1234
+BASELINE_PATH = "benchmarks_baseline.json"
+# Runs slower than the baseline by more than this factor are regressions
+REGRESSION_THRESHOLD = 1.5
+
+
+def measure(fn: Callable[[], object], repeat: int) -> float:
+    """Median wall-clock time of ``repeat`` calls, in seconds."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def random_network(n_nodes: int, max_parents: int = 2) -> BayesianNetwork:
+    rng = random.Random(f"{SEED}-{n_nodes}")
+    nodes = []
+    for i in range(n_nodes):
+        name = f"v{i}"
+        parents = tuple(
+            rng.sample([f"v{j}" for j in range(i)], rng.randint(0, min(i, max_parents)))
+        )
+        if parents:
+            rows = itertools.product([True, False], repeat=len(parents))
+            cpt = ConditionalProbabilityTable(
+                {row: rng.random() for row in rows}, parents
+            )
+        else:
+            cpt = ConditionalProbabilityTable({(True,): rng.random()}, (name,))
+        nodes.append(BayesianNetworkNode(Variable(name, [False, True]), cpt))
+    return BayesianNetwork(nodes)
+
+
+def bench_enumeration(repeat: int) -> Iterator[Tuple[int, float]]:
+    for n_nodes in (6, 8, 10, 12, 14):
+        bn = random_network(n_nodes)
+        x = Variable(f"v{n_nodes - 1}", [False, True])
+        e = {"v0": True}
+        yield n_nodes, measure(lambda: enumeration_ask(x, e, bn), repeat)
+
+
+def fringe_agent(fringe_size: int) -> ProbabilisticAIPlayer:
+    """Agent that visited every other cell of the top row of a square world.
+
+    All visited cells are breezy, so the unvisited top row cells and the
+    cells below the visited ones form a single fringe component of
+    ``fringe_size`` cells (rounded up to an even number).
+    """
+    width = fringe_size + fringe_size % 2
+    grid = [[set() for _ in range(width)] for _ in range(width)]
+    for x in range(0, width, 2):
+        grid[0][x].add(Property.BREEZE)
+    agent = ProbabilisticAIPlayer(Point(0, 0), WumpusWorld(grid))
+    for x in range(0, width, 2):
+        agent._pos = Point(x, 0)
+        agent._visited[0][x] = True
+        agent._perceive()
+    agent._fringe = {(x, y) for x, y in agent._fringe if not agent._visited[y][x]}
+    return agent
+
+
+def bench_ask_probability_unsafe(repeat: int) -> Iterator[Tuple[int, float]]:
+    for fringe_size in (4, 6, 8, 10, 12):
+        agent = fringe_agent(fringe_size)
+        yield fringe_size, measure(lambda: agent._ask_probability_unsafe(1, 0), repeat)
+
+
+def bench_get_safe_pos(repeat: int) -> Iterator[Tuple[int, float]]:
+    for fringe_size in (4, 6, 8, 10, 12):
+        agent = fringe_agent(fringe_size)
+        yield fringe_size, measure(agent._get_safe_pos, repeat)
+
+
+def bench_a_star_route(repeat: int) -> Iterator[Tuple[int, float]]:
+    for size in (4, 6, 8):
+        visited = [[True] * size for _ in range(size)]
+        problem = ShortestPathSearchProblem(
+            Point(0, 0), Point(size - 1, size - 1), visited
+        )
+        yield size, measure(lambda: a_star_route(problem), repeat)
+
+
+def bench_distance_field_route(repeat: int) -> Iterator[Tuple[int, float]]:
+    for size in (8, 16, 32, 64):
+        visited = [[True] * size for _ in range(size)]
+        goal = Point(size - 1, size - 1)
+        yield size, measure(
+            lambda: DistanceFieldPlanner(visited, Point(0, 0)).route(goal), repeat
+        )
+
+
+def bench_dpll_query(repeat: int) -> Iterator[Tuple[int, float]]:
+    for size in (4, 6, 8):
+        world = next(generate_worlds(1, SEED, size, size))
+        agent = LogicAIPlayer(Point(0, 0), world)
+        # Perceive along the first row and column, up to the first hazard
+        for x, y in [(x, 0) for x in range(size)] + [(0, y) for y in range(size)]:
+            if Property.PIT in world[y][x] or Property.WUMPUS in world[y][x]:
+                break
+            agent._pos = Point(x, y)
+            agent._perceive()
+            agent._visited[y][x] = True
+            agent._update_fringe()
+        cells = sorted(agent._fringe)
+
+        def query():
+            for i, j in cells:
+                agent._check_if_no_pit(i, j)
+                agent._check_if_no_wumpus(i, j)
+
+        yield size, measure(query, repeat)
+
+
+BENCHMARKS: Dict[str, Callable[[int], Iterator[Tuple[int, float]]]] = {
+    "enumeration_ask": bench_enumeration,
+    "ask_probability_unsafe": bench_ask_probability_unsafe,
+    "get_safe_pos": bench_get_safe_pos,
+    "a_star_route": bench_a_star_route,
+    "distance_field_route": bench_distance_field_route,
+    "dpll_query": bench_dpll_query,
+}
+
+
+def run(names: List[str], repeat: int) -> Dict[str, Dict[str, float]]:
+    results: Dict[str, Dict[str, float]] = {}
+    for name in names:
+        results[name] = {}
+        for size, seconds in BENCHMARKS[name](repeat):
+            results[name][str(size)] = seconds
+            print(f"{name:<24} size={size:<4} {seconds * 1000:10.3f} ms", flush=True)
+    return results
+
+
+def compare(
+    results: Dict[str, Dict[str, float]],
+    baseline: Dict[str, Dict[str, float]],
+    threshold: float,
+) -> List[str]:
+    """Describe every result slower than its baseline by ``threshold``."""
+    regressions = []
+    for name, sizes in results.items():
+        for size, seconds in sizes.items():
+            base = baseline.get(name, {}).get(size)
+            if base and seconds / base > threshold:
+                regressions.append(
+                    f"{name} size={size}: {seconds * 1000:.3f} ms vs "
+                    f"{base * 1000:.3f} ms baseline ({seconds / base:.2f}x)"
+                )
+    return regressions
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--only", nargs="+", choices=sorted(BENCHMARKS), default=list(BENCHMARKS)
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default="benchmarks.json")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="Store the results as the new baseline",
+    )
+    args = parser.parse_args(argv)
+
+    results = run(args.only, args.repeat)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, run with --save-baseline first")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.threshold)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if not regressions:
+        print(f"No regressions against {args.baseline}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
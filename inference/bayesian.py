@@ -1,4 +1,21 @@
-from typing import Any, Dict, List, Optional, Tuple, Union
+from functools import reduce
+import itertools
+import math
+import operator
+import random
+import statistics
+import time
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Generator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
 
 
 class InvalidCPTException(Exception):
@@ -103,12 +120,15 @@ class BayesianNetwork:
         return self._vars
 
 
-def enumeration_ask(x: Variable, e: Dict[str, Any], bn: BayesianNetwork):
+def enumeration_ask(
+    x: Variable, e: Dict[str, Any], bn: BayesianNetwork, memoize: bool = False
+):
+    enumerate_fn = enumerate_all_memoized if memoize else enumerate_all
     q = {}
     for xi in x:
         ex = e.copy()
         ex[x.name] = xi
-        q[xi] = enumerate_all(bn.vars, ex)
+        q[xi] = enumerate_fn(bn.vars, ex)
 
     # Normalize distribution
     norm_den = sum(q.values())
@@ -120,8 +140,8 @@ def enumeration_ask(x: Variable, e: Dict[str, Any], bn: BayesianNetwork):
 def enumerate_all(vars: List[BayesianNetworkNode], e: Dict[str, Any]) -> float:
     """Compute probability distribution of a variable given observed values.
 
-    TODO: Optimize memory usage, as to get the correct result we are
-    creating copies of observed values
+    Every branch copies the observed values, see ``enumerate_all_memoized``
+    for a version that does not.
 
     :param vars: Variables with their CPT
     :type vars: List[BayesianNetworkNode]
@@ -164,3 +184,634 @@ def enumerate_all(vars: List[BayesianNetworkNode], e: Dict[str, Any]) -> float:
     ey[y.var.name] = False
     sum += (1 - y.cpt[parent]) * enumerate_all(vars[1:], ey)
     return sum
+
+
+def memoized_enumeration(
+    parents: List[Tuple[int, ...]],
+    observed: List[bool],
+    values: List[Any],
+    prob_true: Callable[[int], float],
+) -> float:
+    """Sum of the joint probability over the hidden nodes of a network.
+
+    Nodes are referred to by position, parents before children. Hidden
+    nodes are assigned in place in ``values``, which also holds the observed
+    values, and ``prob_true(i)`` reads it to look up the probability of node
+    ``i`` being true given its parents. The sum over the nodes from position
+    ``i`` onwards only depends on the values of earlier hidden nodes that
+    are parents of those nodes, so it is cached under those values and
+    computed once per combination.
+
+    :param parents: Positions of the parents of every node
+    :type parents: List[Tuple[int, ...]]
+    :param observed: Whether every node is observed
+    :type observed: List[bool]
+    :param values: Value of every node, None for hidden ones
+    :type values: List[Any]
+    :param prob_true: Probability of a node being true given ``values``
+    :type prob_true: Callable[[int], float]
+    :return: Probability of the observed values
+    :rtype: float
+    """
+    n = len(parents)
+
+    # frontier[i] holds the hidden nodes before i read by nodes i and later
+    frontier: List[Tuple[int, ...]] = [()] * (n + 1)
+    needed: set = set()
+    for i in range(n - 1, -1, -1):
+        needed.update(p for p in parents[i] if not observed[p])
+        needed.discard(i)
+        frontier[i] = tuple(sorted(needed))
+
+    cache: Dict[Tuple[int, Tuple[Any, ...]], float] = {}
+
+    def enumerate_from(i: int) -> float:
+        if i == n:
+            return 1
+        key = (i, tuple(values[j] for j in frontier[i]))
+        if key in cache:
+            return cache[key]
+
+        py = prob_true(i)
+        if observed[i]:
+            result = (py if values[i] else 1 - py) * enumerate_from(i + 1)
+        else:
+            values[i] = True
+            result = py * enumerate_from(i + 1)
+            values[i] = False
+            result += (1 - py) * enumerate_from(i + 1)
+            values[i] = None
+        cache[key] = result
+        return result
+
+    return enumerate_from(0)
+
+
+def enumerate_all_memoized(vars: List[BayesianNetworkNode], e: Dict[str, Any]) -> float:
+    """Same sum as ``enumerate_all`` without copying the observed values.
+
+    Variables are assigned in place in a single buffer indexed by node
+    position and the sum is memoised by ``memoized_enumeration``.
+
+    :param vars: Variables with their CPT, parents before children
+    :type vars: List[BayesianNetworkNode]
+    :param e: Observed values
+    :type e: Dict[str, Any]
+    :return: Probability of the observed values
+    :rtype: float
+    """
+    index = {node.var.name: i for i, node in enumerate(vars)}
+    parents = [
+        () if node.is_independent_var() else tuple(index[p] for p in node.cpt.varnames)
+        for node in vars
+    ]
+    observed = [node.var.name in e for node in vars]
+    values = [e.get(node.var.name) for node in vars]
+
+    def prob_true(i: int) -> float:
+        if parents[i]:
+            return vars[i].cpt[tuple(values[j] for j in parents[i])]
+        return vars[i].cpt[(True,)]
+
+    return memoized_enumeration(parents, observed, values, prob_true)
+
+
+class Factor:
+    def __init__(
+        self,
+        varnames: Tuple[str, ...],
+        domains: Dict[str, List[Any]],
+        table: Dict[Tuple[Any, ...], float],
+    ) -> None:
+        self._varnames = varnames
+        self._domains = domains
+        self._table = table
+
+    @property
+    def varnames(self) -> Tuple[str, ...]:
+        return self._varnames
+
+    @property
+    def table(self) -> Dict[Tuple[Any, ...], float]:
+        return self._table
+
+    def _combine(self, other: "Factor", op: Callable[[float, float], float]):
+        varnames = self.varnames + tuple(
+            name for name in other.varnames if name not in self.varnames
+        )
+        domains = {**self._domains, **other._domains}
+        left = [varnames.index(name) for name in self.varnames]
+        right = [varnames.index(name) for name in other.varnames]
+        table = {}
+        for row in itertools.product(*(domains[name] for name in varnames)):
+            table[row] = op(
+                self._table[tuple(row[i] for i in left)],
+                other._table[tuple(row[i] for i in right)],
+            )
+        return Factor(varnames, domains, table)
+
+    def __mul__(self, other: "Factor") -> "Factor":
+        return self._combine(other, operator.mul)
+
+    def __truediv__(self, other: "Factor") -> "Factor":
+        # 0 / 0 is taken as 0, as needed when dividing out separators
+        return self._combine(other, lambda a, b: a / b if b else 0)
+
+    def sum_out(self, varname: str) -> "Factor":
+        idx = self.varnames.index(varname)
+        varnames = self.varnames[:idx] + self.varnames[idx + 1 :]
+        table: Dict[Tuple[Any, ...], float] = {}
+        for row, value in self._table.items():
+            key = row[:idx] + row[idx + 1 :]
+            table[key] = table.get(key, 0) + value
+        return Factor(varnames, self._domains, table)
+
+    def marginal(self, varnames: Tuple[str, ...]) -> "Factor":
+        """Sum out every variable not in ``varnames``."""
+        idx = [self.varnames.index(name) for name in varnames]
+        table: Dict[Tuple[Any, ...], float] = {
+            row: 0 for row in itertools.product(*(self._domains[n] for n in varnames))
+        }
+        for row, value in self._table.items():
+            table[tuple(row[i] for i in idx)] += value
+        return Factor(varnames, self._domains, table)
+
+    def normalize(self) -> "Factor":
+        total = sum(self._table.values())
+        if total == 0:
+            return self
+        table = {row: value / total for row, value in self._table.items()}
+        return Factor(self.varnames, self._domains, table)
+
+    def __repr__(self) -> str:
+        return f"Factor({self.varnames})"
+
+
+def node_factor(
+    node: BayesianNetworkNode, bn: BayesianNetwork, e: Dict[str, Any]
+) -> Factor:
+    """Build the factor of a node CPT with the observed variables fixed.
+
+    :param node: Node whose CPT is turned into a factor
+    :type node: BayesianNetworkNode
+    :param bn: Network the node belongs to, used to look up parent domains
+    :type bn: BayesianNetwork
+    :param e: Observed values
+    :type e: Dict[str, Any]
+    :return: Factor over the unobserved variables among the node and its parents
+    :rtype: Factor
+    """
+    domains = {n.var.name: list(n.var) for n in bn.vars}
+    parents = () if node.is_independent_var() else node.cpt.varnames
+    name = node.var.name
+    varnames = tuple(p for p in parents + (name,) if p not in e)
+    table = {}
+    for row in itertools.product(*(domains[v] for v in varnames)):
+        assignment = {**e, **dict(zip(varnames, row))}
+        if node.is_independent_var():
+            py = node.cpt[(True,)]
+        else:
+            py = node.cpt[tuple(assignment[p] for p in parents)]
+        table[row] = py if assignment[name] else 1 - py
+    return Factor(varnames, {v: domains[v] for v in varnames}, table)
+
+
+def relevant_nodes(
+    x: Variable, e: Dict[str, Any], bn: BayesianNetwork
+) -> List[BayesianNetworkNode]:
+    """Drop nodes that are not ancestors of the query or the evidence.
+
+    Such nodes sum out to one, so they can be removed before inference.
+    """
+    nodes = {node.var.name: node for node in bn.vars}
+    keep = set()
+    pending = [x.name, *e]
+    while pending:
+        name = pending.pop()
+        if name in keep:
+            continue
+        keep.add(name)
+        node = nodes[name]
+        if not node.is_independent_var():
+            pending.extend(node.cpt.varnames)
+    return [node for node in bn.vars if node.var.name in keep]
+
+
+def interaction_graph(factors: List[Factor]) -> Dict[str, Set[str]]:
+    """Link every pair of variables that appear in the same factor.
+
+    Built from CPT factors this is the moral graph of the network.
+    """
+    graph: Dict[str, Set[str]] = {}
+    for f in factors:
+        for name in f.varnames:
+            graph.setdefault(name, set()).update(
+                other for other in f.varnames if other != name
+            )
+    return graph
+
+
+def elimination_order(
+    factors: List[Factor], hidden: List[str], heuristic: str = "min_fill"
+) -> List[str]:
+    """Greedily choose the order in which hidden variables are summed out.
+
+    :param factors: Factors the variables appear in
+    :type factors: List[Factor]
+    :param hidden: Variables to eliminate
+    :type hidden: List[str]
+    :param heuristic: Either "min_fill" or "min_degree"
+    :type heuristic: str
+    :return: Elimination order
+    :rtype: List[str]
+    """
+    if heuristic not in ("min_fill", "min_degree"):
+        raise ValueError(f"Unknown elimination heuristic: {heuristic}")
+
+    graph = interaction_graph(factors)
+
+    def cost(name: str) -> int:
+        neighbours = graph[name]
+        if heuristic == "min_degree":
+            return len(neighbours)
+        return sum(
+            1 for a, b in itertools.combinations(neighbours, 2) if b not in graph[a]
+        )
+
+    order = []
+    remaining = set(hidden)
+    while remaining:
+        name = min(sorted(remaining), key=cost)
+        neighbours = graph.pop(name)
+        for a in neighbours:
+            graph[a].discard(name)
+            graph[a].update(n for n in neighbours if n != a)
+        remaining.remove(name)
+        order.append(name)
+    return order
+
+
+def elimination_ask(
+    x: Variable, e: Dict[str, Any], bn: BayesianNetwork, heuristic: str = "min_fill"
+):
+    """Compute the distribution of a variable given observed values.
+
+    Same query as ``enumeration_ask``, answered by variable elimination, so
+    the cost is exponential in the width of the elimination order instead of
+    in the number of hidden variables.
+
+    :param x: Query variable
+    :type x: Variable
+    :param e: Observed values
+    :type e: Dict[str, Any]
+    :param bn: Bayesian network
+    :type bn: BayesianNetwork
+    :param heuristic: Elimination ordering heuristic, "min_fill" or "min_degree"
+    :type heuristic: str
+    :return: Probability of each value of the query variable
+    :rtype: Dict[Any, float]
+    """
+    if x.name in e:
+        return {xi: float(xi == e[x.name]) for xi in x}
+
+    nodes = relevant_nodes(x, e, bn)
+    factors = [node_factor(node, bn, e) for node in nodes]
+    hidden = [
+        node.var.name
+        for node in nodes
+        if node.var.name not in e and node.var.name != x.name
+    ]
+    for name in elimination_order(factors, hidden, heuristic):
+        related = [f for f in factors if name in f.varnames]
+        factors = [f for f in factors if name not in f.varnames]
+        factors.append(reduce(lambda f, g: f * g, related).sum_out(name))
+
+    result = reduce(lambda f, g: f * g, factors)
+    q = {xi: result.table[(xi,)] for xi in x}
+
+    # Normalize distribution
+    norm_den = sum(q.values())
+    for key in q:
+        q[key] /= norm_den
+    return q
+
+
+class SamplingEstimate:
+    def __init__(
+        self,
+        distribution: Dict[Any, float],
+        std_error: Dict[Any, float],
+        n_samples: int,
+    ) -> None:
+        self._distribution = distribution
+        self._std_error = std_error
+        self._n_samples = n_samples
+
+    @property
+    def distribution(self) -> Dict[Any, float]:
+        return self._distribution
+
+    @property
+    def std_error(self) -> Dict[Any, float]:
+        return self._std_error
+
+    @property
+    def n_samples(self) -> int:
+        return self._n_samples
+
+    def __repr__(self) -> str:
+        return (
+            f"SamplingEstimate({self.distribution}, "
+            f"std_error={self.std_error}, n_samples={self.n_samples})"
+        )
+
+
+class _SampleAccumulator:
+    """Running weighted counts of the query variable values.
+
+    The standard error comes from the effective sample size of the weights,
+    or, with ``batch_means``, from the spread of the estimates of consecutive
+    batches, which accounts for correlated samples as Gibbs sampling draws.
+    """
+
+    def __init__(self, x: Variable, batch_size: int, batch_means: bool) -> None:
+        self._x = x
+        self._batch_size = batch_size
+        self._batch_means = batch_means
+        self._weights = {xi: 0.0 for xi in x}
+        self._sq_weights = 0.0
+        self._n = 0
+        self._batch = {xi: 0.0 for xi in x}
+        self._batch_estimates: List[Dict[Any, float]] = []
+
+    def add(self, value: Any, weight: float) -> None:
+        self._weights[value] += weight
+        self._sq_weights += weight * weight
+        self._n += 1
+        if self._batch_means:
+            self._batch[value] += weight
+            if self._n % self._batch_size == 0:
+                total = sum(self._batch.values())
+                if total > 0:
+                    self._batch_estimates.append(
+                        {xi: w / total for xi, w in self._batch.items()}
+                    )
+                self._batch = {xi: 0.0 for xi in self._x}
+
+    def estimate(self) -> SamplingEstimate:
+        total = sum(self._weights.values())
+        if total == 0:
+            nan = {xi: float("nan") for xi in self._x}
+            return SamplingEstimate(nan, dict(nan), self._n)
+
+        q = {xi: w / total for xi, w in self._weights.items()}
+        if self._batch_means and len(self._batch_estimates) > 1:
+            k = len(self._batch_estimates)
+            se = {
+                xi: statistics.stdev(b[xi] for b in self._batch_estimates)
+                / math.sqrt(k)
+                for xi in self._x
+            }
+        else:
+            effective_size = total * total / self._sq_weights
+            se = {xi: math.sqrt(p * (1 - p) / effective_size) for xi, p in q.items()}
+        return SamplingEstimate(q, se, self._n)
+
+
+def _prob_true(node: BayesianNetworkNode, sample: Dict[str, Any]) -> float:
+    if node.is_independent_var():
+        return node.cpt[(True,)]
+    return node.cpt[tuple(sample[p] for p in node.cpt.varnames)]
+
+
+def _weighted_sample(
+    e: Dict[str, Any], bn: BayesianNetwork, rng: random.Random
+) -> Tuple[Dict[str, Any], float]:
+    sample = {}
+    weight = 1.0
+    for node in bn.vars:
+        name = node.var.name
+        py = _prob_true(node, sample)
+        if name in e:
+            sample[name] = e[name]
+            weight *= py if e[name] else 1 - py
+        else:
+            sample[name] = rng.random() < py
+    return sample, weight
+
+
+def _likelihood_weighting_samples(
+    x: Variable, e: Dict[str, Any], bn: BayesianNetwork, rng: random.Random
+) -> Generator[Tuple[Any, float], None, None]:
+    while True:
+        sample, weight = _weighted_sample(e, bn, rng)
+        yield sample[x.name], weight
+
+
+def _gibbs_samples(
+    x: Variable,
+    e: Dict[str, Any],
+    bn: BayesianNetwork,
+    rng: random.Random,
+    burn_in: int,
+) -> Generator[Tuple[Any, float], None, None]:
+    children: Dict[str, List[BayesianNetworkNode]] = {
+        node.var.name: [] for node in bn.vars
+    }
+    for node in bn.vars:
+        if not node.is_independent_var():
+            for p in node.cpt.varnames:
+                children[p].append(node)
+    hidden = [node for node in bn.vars if node.var.name not in e]
+
+    # Start from a state consistent with the evidence whenever one is found
+    for _ in range(1000):
+        state, weight = _weighted_sample(e, bn, rng)
+        if weight > 0:
+            break
+
+    def blanket_weight(node: BayesianNetworkNode) -> float:
+        py = _prob_true(node, state)
+        weight = py if state[node.var.name] else 1 - py
+        for child in children[node.var.name]:
+            pc = _prob_true(child, state)
+            weight *= pc if state[child.var.name] else 1 - pc
+        return weight
+
+    sweeps = 0
+    while True:
+        for node in hidden:
+            name = node.var.name
+            state[name] = True
+            w_true = blanket_weight(node)
+            state[name] = False
+            w_false = blanket_weight(node)
+            if w_true + w_false > 0:
+                state[name] = rng.random() < w_true / (w_true + w_false)
+            else:
+                state[name] = rng.random() < _prob_true(node, state)
+        sweeps += 1
+        if sweeps > burn_in:
+            yield state[x.name], 1.0
+
+
+def _run_sampler(
+    samples: Generator[Tuple[Any, float], None, None],
+    acc: _SampleAccumulator,
+    n_samples: Optional[int],
+    time_budget: Optional[float],
+    batch_size: int,
+) -> SamplingEstimate:
+    if n_samples is None and time_budget is None:
+        raise ValueError("Either n_samples or time_budget must be provided")
+
+    deadline = None if time_budget is None else time.perf_counter() + time_budget
+    for i, (value, weight) in enumerate(samples, 1):
+        acc.add(value, weight)
+        if n_samples is not None and i >= n_samples:
+            break
+        if (
+            deadline is not None
+            and i % batch_size == 0
+            and time.perf_counter() >= deadline
+        ):
+            break
+    return acc.estimate()
+
+
+def _iter_estimates(
+    samples: Generator[Tuple[Any, float], None, None],
+    acc: _SampleAccumulator,
+    batch_size: int,
+) -> Generator[SamplingEstimate, None, None]:
+    for i, (value, weight) in enumerate(samples, 1):
+        acc.add(value, weight)
+        if i % batch_size == 0:
+            yield acc.estimate()
+
+
+def likelihood_weighting(
+    x: Variable,
+    e: Dict[str, Any],
+    bn: BayesianNetwork,
+    n_samples: Optional[int] = None,
+    time_budget: Optional[float] = None,
+    seed: Optional[int] = None,
+    batch_size: int = 100,
+) -> SamplingEstimate:
+    """Estimate the distribution of a variable by likelihood weighting.
+
+    Sampling stops after ``n_samples`` samples or once ``time_budget``
+    seconds have passed, whichever comes first. The clock is checked every
+    ``batch_size`` samples.
+
+    :param x: Query variable
+    :type x: Variable
+    :param e: Observed values
+    :type e: Dict[str, Any]
+    :param bn: Bayesian network
+    :type bn: BayesianNetwork
+    :param n_samples: Maximum number of samples
+    :type n_samples: Optional[int]
+    :param time_budget: Maximum wall-clock time in seconds
+    :type time_budget: Optional[float]
+    :param seed: Seed for reproducible results
+    :type seed: Optional[int]
+    :param batch_size: Samples between clock checks
+    :type batch_size: int
+    :return: Estimated distribution with its standard error
+    :rtype: SamplingEstimate
+    """
+    rng = random.Random(seed)
+    return _run_sampler(
+        _likelihood_weighting_samples(x, e, bn, rng),
+        _SampleAccumulator(x, batch_size, batch_means=False),
+        n_samples,
+        time_budget,
+        batch_size,
+    )
+
+
+def likelihood_weighting_iter(
+    x: Variable,
+    e: Dict[str, Any],
+    bn: BayesianNetwork,
+    seed: Optional[int] = None,
+    batch_size: int = 100,
+) -> Generator[SamplingEstimate, None, None]:
+    """Yield a refined likelihood weighting estimate every ``batch_size`` samples.
+
+    The generator never ends, the caller stops it by no longer iterating.
+    """
+    rng = random.Random(seed)
+    yield from _iter_estimates(
+        _likelihood_weighting_samples(x, e, bn, rng),
+        _SampleAccumulator(x, batch_size, batch_means=False),
+        batch_size,
+    )
+
+
+def gibbs_ask(
+    x: Variable,
+    e: Dict[str, Any],
+    bn: BayesianNetwork,
+    n_samples: Optional[int] = None,
+    time_budget: Optional[float] = None,
+    seed: Optional[int] = None,
+    burn_in: int = 100,
+    batch_size: int = 100,
+) -> SamplingEstimate:
+    """Estimate the distribution of a variable by Gibbs sampling.
+
+    Each sample is one sweep resampling every hidden variable from its
+    Markov blanket. The first ``burn_in`` sweeps are discarded and the
+    standard error is computed from the means of batches of ``batch_size``
+    samples. Stopping works as in ``likelihood_weighting``.
+
+    :param x: Query variable
+    :type x: Variable
+    :param e: Observed values
+    :type e: Dict[str, Any]
+    :param bn: Bayesian network
+    :type bn: BayesianNetwork
+    :param n_samples: Maximum number of samples
+    :type n_samples: Optional[int]
+    :param time_budget: Maximum wall-clock time in seconds
+    :type time_budget: Optional[float]
+    :param seed: Seed for reproducible results
+    :type seed: Optional[int]
+    :param burn_in: Sweeps discarded before sampling
+    :type burn_in: int
+    :param batch_size: Samples per batch and between clock checks
+    :type batch_size: int
+    :return: Estimated distribution with its standard error
+    :rtype: SamplingEstimate
+    """
+    rng = random.Random(seed)
+    return _run_sampler(
+        _gibbs_samples(x, e, bn, rng, burn_in),
+        _SampleAccumulator(x, batch_size, batch_means=True),
+        n_samples,
+        time_budget,
+        batch_size,
+    )
+
+
+def gibbs_ask_iter(
+    x: Variable,
+    e: Dict[str, Any],
+    bn: BayesianNetwork,
+    seed: Optional[int] = None,
+    burn_in: int = 100,
+    batch_size: int = 100,
+) -> Generator[SamplingEstimate, None, None]:
+    """Yield a refined Gibbs sampling estimate every ``batch_size`` samples.
+
+    The generator never ends, the caller stops it by no longer iterating.
+    """
+    rng = random.Random(seed)
+    yield from _iter_estimates(
+        _gibbs_samples(x, e, bn, rng, burn_in),
+        _SampleAccumulator(x, batch_size, batch_means=True),
+        batch_size,
+    )
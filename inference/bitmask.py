@@ -0,0 +1,82 @@
+from typing import List, Tuple, Union
+
+import numpy as np
+
+# Assignments are enumerated in blocks of 2^CHUNK_BITS to bound memory usage
+CHUNK_BITS = 20
+
+_M1 = np.uint64(0x5555555555555555)
+_M2 = np.uint64(0x3333333333333333)
+_M4 = np.uint64(0x0F0F0F0F0F0F0F0F)
+_H01 = np.uint64(0x0101010101010101)
+
+
+def popcount(masks: np.ndarray) -> np.ndarray:
+    """Count the bits set in every element of an unsigned 64 bit array.
+
+    :param masks: Bitmasks to count
+    :type masks: np.ndarray
+    :return: Number of bits set in each mask
+    :rtype: np.ndarray
+    """
+    x = masks - ((masks >> np.uint64(1)) & _M1)
+    x = (x & _M2) + ((x >> np.uint64(2)) & _M2)
+    x = (x + (x >> np.uint64(4))) & _M4
+    return (x * _H01) >> np.uint64(56)
+
+
+def unsafe_marginals(
+    n_vars: int,
+    constraints: List[Tuple[int, bool]],
+    prior: float,
+    return_consistent: bool = False,
+) -> Union[np.ndarray, Tuple[np.ndarray, int]]:
+    """Compute the probability of each binary variable being true.
+
+    Every assignment of the ``n_vars`` variables is encoded as an integer
+    whose i-th bit holds the value of the i-th variable. Each constraint is a
+    ``(mask, observed)`` pair stating that the disjunction of the variables
+    in ``mask`` must equal ``observed``, as a breeze or stench percept does
+    for the cells around it. Variables are independent a priori and true
+    with probability ``prior``.
+
+    :param n_vars: Number of variables
+    :type n_vars: int
+    :param constraints: Disjunction masks and their observed value
+    :type constraints: List[Tuple[int, bool]]
+    :param prior: Prior probability of a variable being true
+    :type prior: float
+    :param return_consistent: Also return the number of consistent assignments
+    :type return_consistent: bool
+    :return: Posterior probability of each variable being true
+    :rtype: Union[np.ndarray, Tuple[np.ndarray, int]]
+    """
+    n_events = 1 << n_vars
+    chunk = min(n_events, 1 << CHUNK_BITS)
+    n_set = np.arange(n_vars + 1)
+    # Prior weight of an assignment only depends on how many variables are set
+    weight_by_count = prior**n_set * (1 - prior) ** (n_vars - n_set)
+    bits = np.arange(n_vars, dtype=np.uint64)
+    total = 0.0
+    n_consistent = 0
+    unsafe_mass = np.zeros(n_vars)
+    for start in range(0, n_events, chunk):
+        masks = np.arange(start, start + chunk, dtype=np.uint64)
+        consistent = np.ones(chunk, dtype=bool)
+        for mask, observed in constraints:
+            touched = (masks & np.uint64(mask)) != 0
+            consistent &= touched if observed else ~touched
+        masks = masks[consistent]
+        if not len(masks):
+            continue
+        n_consistent += len(masks)
+
+        weights = weight_by_count[popcount(masks).astype(np.intp)]
+        total += weights.sum()
+        is_set = ((masks[:, None] >> bits) & np.uint64(1)).astype(bool)
+        unsafe_mass += weights @ is_set
+
+    marginals = unsafe_mass / total if total else np.full(n_vars, prior)
+    if return_consistent:
+        return marginals, n_consistent
+    return marginals
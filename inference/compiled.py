@@ -0,0 +1,122 @@
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from inference.bayesian import (
+    BayesianNetwork,
+    InvalidCPTException,
+    Variable,
+    memoized_enumeration,
+)
+
+
+class CompiledBayesianNetwork:
+    """Boolean Bayesian network with CPTs stored as dense arrays.
+
+    Nodes are referred to by their position in the network. The CPT of a
+    node with ``k`` parents is an array of ``2**k`` probabilities of the node
+    being true, where bit ``b`` of the index holds the value of the ``b``-th
+    parent.
+    """
+
+    def __init__(
+        self,
+        names: List[str],
+        parents: List[Tuple[int, ...]],
+        cpts: List[np.ndarray],
+    ) -> None:
+        self._names = names
+        self._index = {name: i for i, name in enumerate(names)}
+        self._parents = parents
+        self._cpts = cpts
+
+    @property
+    def names(self) -> List[str]:
+        return self._names
+
+    @property
+    def parents(self) -> List[Tuple[int, ...]]:
+        return self._parents
+
+    @property
+    def cpts(self) -> List[np.ndarray]:
+        return self._cpts
+
+    def index(self, name: str) -> int:
+        return self._index[name]
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    @classmethod
+    def from_network(cls, bn: BayesianNetwork) -> "CompiledBayesianNetwork":
+        names = [node.var.name for node in bn.vars]
+        index = {name: i for i, name in enumerate(names)}
+        parents = []
+        cpts = []
+        for node in bn.vars:
+            if node.is_independent_var():
+                parents.append(())
+                cpts.append(np.array([node.cpt[(True,)]]))
+                continue
+
+            parents.append(tuple(index[p] for p in node.cpt.varnames))
+            n_parents = node.cpt.n_vars
+            cpt = np.empty(1 << n_parents)
+            for mask in range(1 << n_parents):
+                row = tuple(bool(mask >> b & 1) for b in range(n_parents))
+                if row not in node.cpt:
+                    raise InvalidCPTException(
+                        f"Missing CPT row {row} for variable {node.var.name}"
+                    )
+                cpt[mask] = node.cpt[row]
+            cpts.append(cpt)
+        return cls(names, parents, cpts)
+
+
+def compiled_enumeration_ask(
+    x: Variable, e: Dict[str, Any], cbn: CompiledBayesianNetwork
+) -> Dict[bool, float]:
+    """Enumeration query on a compiled network.
+
+    Runs the same ``memoized_enumeration`` as ``enumerate_all_memoized``,
+    but CPT rows are found from a parent bitmask, so the inner loop does no
+    name lookups.
+
+    :param x: Query variable
+    :type x: Variable
+    :param e: Observed values
+    :type e: Dict[str, Any]
+    :param cbn: Compiled Bayesian network
+    :type cbn: CompiledBayesianNetwork
+    :return: Probability of each value of the query variable
+    :rtype: Dict[bool, float]
+    """
+    n = len(cbn)
+    parents = cbn.parents
+    cpts = [cpt.tolist() for cpt in cbn.cpts]
+    observed = [False] * n
+    values: List[Any] = [None] * n
+    for name, value in e.items():
+        observed[cbn.index(name)] = True
+        values[cbn.index(name)] = bool(value)
+    xi_idx = cbn.index(x.name)
+    observed[xi_idx] = True
+
+    def prob_true(i: int) -> float:
+        mask = 0
+        for b, p in enumerate(parents[i]):
+            if values[p]:
+                mask |= 1 << b
+        return cpts[i][mask]
+
+    q = {}
+    for xi in x:
+        values[xi_idx] = xi
+        q[xi] = memoized_enumeration(parents, observed, values, prob_true)
+
+    # Normalize distribution
+    norm_den = sum(q.values())
+    for key in q:
+        q[key] /= norm_den
+    return q
@@ -0,0 +1,203 @@
+from collections import deque
+import itertools
+from typing import Any, Dict, FrozenSet, List, Optional, Set, Tuple
+
+from inference.bayesian import (
+    BayesianNetwork,
+    Factor,
+    elimination_order,
+    interaction_graph,
+    node_factor,
+)
+
+# Separator updates whose ratio to the previous one is constant within this
+# tolerance only rescale the cliques behind them, so they are not propagated
+RATIO_TOLERANCE = 1e-12
+
+
+def elimination_cliques(
+    factors: List[Factor], heuristic: str = "min_fill"
+) -> List[FrozenSet[str]]:
+    """Maximal cliques of the moral graph triangulated by variable elimination.
+
+    :param factors: CPT factors of the network
+    :type factors: List[Factor]
+    :param heuristic: Elimination ordering heuristic, "min_fill" or "min_degree"
+    :type heuristic: str
+    :return: Maximal cliques of the triangulated graph
+    :rtype: List[FrozenSet[str]]
+    """
+    graph = interaction_graph(factors)
+    order = elimination_order(factors, list(graph), heuristic)
+    cliques: List[FrozenSet[str]] = []
+    for name in order:
+        neighbours = graph.pop(name)
+        clique = frozenset(neighbours | {name})
+        if not any(clique <= other for other in cliques):
+            cliques.append(clique)
+        for a in neighbours:
+            graph[a].discard(name)
+            graph[a].update(n for n in neighbours if n != a)
+    return cliques
+
+
+class JunctionTree:
+    """Clique tree of a Bayesian network calibrated with Hugin propagation.
+
+    The tree is calibrated once when built. Evidence is then absorbed one
+    variable at a time: it is multiplied into a single clique and messages
+    only travel outwards from that clique until a separator changes by no
+    more than a constant factor, so untouched parts of the tree are left
+    alone. Marginals are cached per variable and only recomputed for the
+    cliques an update reached.
+    """
+
+    def __init__(
+        self,
+        bn: BayesianNetwork,
+        e: Optional[Dict[str, Any]] = None,
+        heuristic: str = "min_fill",
+    ) -> None:
+        factors = [node_factor(node, bn, {}) for node in bn.vars]
+        self._domains = {node.var.name: list(node.var) for node in bn.vars}
+        self._cliques = elimination_cliques(factors, heuristic)
+        self._neighbours: List[Set[int]] = [set() for _ in self._cliques]
+        self._separators: Dict[Tuple[int, int], Factor] = {}
+        self._build_tree()
+
+        self._potentials = [self._ones(clique) for clique in self._cliques]
+        for f in factors:
+            home = self._smallest_clique(set(f.varnames))
+            self._potentials[home] = self._potentials[home] * f
+
+        self._evidence: Dict[str, Any] = {}
+        self._marginals: Dict[str, Dict[Any, float]] = {}
+        self._calibrate()
+        for name, value in (e or {}).items():
+            self.observe(name, value)
+
+    @property
+    def cliques(self) -> List[FrozenSet[str]]:
+        return self._cliques
+
+    @property
+    def evidence(self) -> Dict[str, Any]:
+        return self._evidence
+
+    def _ones(self, varnames) -> Factor:
+        varnames = tuple(sorted(varnames))
+        domains = {name: self._domains[name] for name in varnames}
+        rows = itertools.product(*(domains[name] for name in varnames))
+        return Factor(varnames, domains, {row: 1.0 for row in rows})
+
+    def _smallest_clique(self, varnames: Set[str]) -> int:
+        candidates = [i for i, clique in enumerate(self._cliques) if varnames <= clique]
+        return min(candidates, key=lambda i: len(self._cliques[i]))
+
+    def _build_tree(self) -> None:
+        # Maximum spanning tree on separator sizes (Prim), which keeps the
+        # running intersection property. Disconnected parts of the network
+        # are joined through empty separators.
+        n = len(self._cliques)
+        in_tree = {0}
+        while len(in_tree) < n:
+            i, j = max(
+                ((i, j) for i in in_tree for j in range(n) if j not in in_tree),
+                key=lambda ij: len(self._cliques[ij[0]] & self._cliques[ij[1]]),
+            )
+            in_tree.add(j)
+            self._neighbours[i].add(j)
+            self._neighbours[j].add(i)
+            sep = self._cliques[i] & self._cliques[j]
+            self._separators[i, j] = self._separators[j, i] = self._ones(sep)
+
+    def _pass_message(self, src: int, dst: int) -> bool:
+        """Absorb clique ``src`` into ``dst``.
+
+        :return: Whether the separator changed by more than a constant factor
+        :rtype: bool
+        """
+        old = self._separators[src, dst]
+        new = self._potentials[src].marginal(old.varnames)
+        ratio = new / old
+        self._separators[src, dst] = self._separators[dst, src] = new
+        self._potentials[dst] = self._potentials[dst] * ratio
+
+        values = [ratio.table[row] for row, v in old.table.items() if v]
+        return bool(values) and (
+            max(values) - min(values) > RATIO_TOLERANCE * max(values)
+        )
+
+    def _calibrate(self) -> None:
+        order = self._traversal(0)
+        for parent, child in reversed(order):
+            self._pass_message(child, parent)
+        for parent, child in order:
+            self._pass_message(parent, child)
+        self._marginals.clear()
+
+    def _traversal(self, root: int) -> List[Tuple[int, int]]:
+        edges = []
+        queue = deque([root])
+        seen = {root}
+        while queue:
+            i = queue.popleft()
+            for j in self._neighbours[i]:
+                if j not in seen:
+                    seen.add(j)
+                    edges.append((i, j))
+                    queue.append(j)
+        return edges
+
+    def _invalidate(self, clique: int) -> None:
+        for name in self._cliques[clique]:
+            self._marginals.pop(name, None)
+
+    def observe(self, name: str, value: Any) -> None:
+        """Absorb an observed value and propagate it through the tree.
+
+        :param name: Observed variable
+        :type name: str
+        :param value: Observed value
+        :type value: Any
+        """
+        if name in self._evidence:
+            if self._evidence[name] != value:
+                raise ValueError(
+                    f"{name} already observed as {self._evidence[name]}, got {value}"
+                )
+            return
+
+        self._evidence[name] = value
+        indicator = Factor(
+            (name,),
+            {name: self._domains[name]},
+            {(v,): float(v == value) for v in self._domains[name]},
+        )
+        home = self._smallest_clique({name})
+        self._potentials[home] = (self._potentials[home] * indicator).normalize()
+        self._invalidate(home)
+
+        queue = deque([home])
+        reached = {home}
+        while queue:
+            i = queue.popleft()
+            for j in self._neighbours[i]:
+                if j in reached:
+                    continue
+                reached.add(j)
+                if self._pass_message(i, j):
+                    self._invalidate(j)
+                    queue.append(j)
+
+    def marginal(self, name: str) -> Dict[Any, float]:
+        """Distribution of a variable given all the evidence observed so far."""
+        if name not in self._marginals:
+            home = self._smallest_clique({name})
+            f = self._potentials[home].marginal((name,)).normalize()
+            self._marginals[name] = {row[0]: p for row, p in f.table.items()}
+        return self._marginals[name]
+
+    def marginals(self) -> Dict[str, Dict[Any, float]]:
+        """Distribution of every variable given the evidence observed so far."""
+        return {name: self.marginal(name) for name in self._domains}
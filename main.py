@@ -1,7 +1,10 @@
+import argparse
+import queue
 import sys
+import threading
 import time
 import pygame
-from typing import Dict, Iterable, List, Tuple
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
 from consts import (
     BLACK,
     BLOCK_SIZE,
@@ -16,14 +19,18 @@ from consts import (
     Property,
 )
 from utils import Point
-from player import HumanPlayer, LogicAIPlayer, ProbabilisticAIPlayer
+from player import HumanPlayer, LogicAIPlayer, Player, ProbabilisticAIPlayer
 from wumpus import (
     WumpusWorld,
     create_wumpus_world1,
     create_wumpus_world2,
     WumpusWorldGenerator,
+    generate_worlds,
 )
 
+# Cells kept between the player and the viewport edges when scrolling
+CAMERA_MARGIN = 1
+FPS = 60
 
 breeze = pygame.transform.scale(
     pygame.image.load("assets/breeze.png"), (IMAGES_WIDTH, IMAGES_HEIGHT)
@@ -61,32 +68,48 @@ class Tile:
     ):
         self._properties = properties
         self._size = size
-        self._surface = pygame.Surface(size)
         self._rect = pygame.Rect(pos.x, pos.y, *size)
+        # Pre-rendered static layer, created on first draw
+        self._surface: Optional[pygame.Surface] = None
 
-    def draw(self, canvas: pygame.Surface) -> None:
+    @property
+    def rect(self) -> pygame.Rect:
+        return self._rect
+
+    def _render(self) -> pygame.Surface:
+        surface = pygame.Surface(self._size)
+        surface.fill(WHITE)
+        center = surface.get_rect().center
         if Property.PIT in self._properties:
-            pygame.draw.circle(canvas, BLACK, self._rect.center, BLOCK_SIZE // 3)
+            pygame.draw.circle(surface, BLACK, center, BLOCK_SIZE // 3)
 
         if Property.BREEZE in self._properties:
             rect = breeze.get_rect()
-            rect.center = (self._rect.center[0] - OFFSET, self._rect.center[1] - OFFSET)
-            canvas.blit(breeze, rect)
+            rect.center = (center[0] - OFFSET, center[1] - OFFSET)
+            surface.blit(breeze, rect)
 
         if Property.STENCH in self._properties:
             rect = stench.get_rect()
-            rect.center = (self._rect.center[0], self._rect.center[1] - OFFSET)
-            canvas.blit(stench, rect)
+            rect.center = (center[0], center[1] - OFFSET)
+            surface.blit(stench, rect)
 
         if Property.WUMPUS in self._properties:
             rect = wumpus.get_rect()
-            rect.center = (self._rect.center[0], self._rect.center[1])
-            canvas.blit(wumpus, rect)
+            rect.center = (center[0], center[1])
+            surface.blit(wumpus, rect)
 
         if Property.GOLD in self._properties:
             rect = gold.get_rect()
-            rect.center = (self._rect.center[0], self._rect.center[1] + OFFSET)
-            canvas.blit(gold, rect)
+            rect.center = (center[0], center[1] + OFFSET)
+            surface.blit(gold, rect)
+
+        pygame.draw.rect(surface, BLACK, surface.get_rect(), 1)
+        return surface
+
+    def draw(self, canvas: pygame.Surface, dest: Optional[pygame.Rect] = None) -> None:
+        if self._surface is None:
+            self._surface = self._render()
+        canvas.blit(self._surface, self._rect if dest is None else dest)
 
 
 class Pane(object):
@@ -114,44 +137,230 @@ class Pane(object):
 
 
 class Map:
-    def __init__(self, tiles: Dict[Tuple[int, int], Tile]):
-        self._tiles = tiles
+    """Tiles of a grid, each created the first time it is needed."""
+
+    def __init__(self, grid: List[List[Iterable[Property]]]):
+        self._grid = grid
+        self._tiles: Dict[Tuple[int, int], Tile] = {}
 
-    def draw(self, canvas: pygame.Surface):
-        for _, tile in self._tiles.items():
-            tile.draw(canvas)
+    @property
+    def width(self) -> int:
+        return len(self._grid[0])
 
-    def get_tiles_coords(self):
-        return self._tiles.keys()
+    @property
+    def height(self) -> int:
+        return len(self._grid)
 
     @classmethod
     def from_list(cls, grid: List[List[Iterable[Property]]]) -> "Map":
-        tiles = {}
-        #  For now we limit size to 6
-        for j, x in zip(range(X_TILE_COUNT), range(0, WINDOW_WIDTH, BLOCK_SIZE)):
-            for i, y in zip(range(Y_TILE_COUNT), range(0, WINDOW_HEIGHT, BLOCK_SIZE)):
-                tiles[(x, y)] = Tile(Point(x, y), grid[i][j])
+        return cls(grid)
 
-        return cls(tiles)
+    def tile(self, i: int, j: int) -> Tile:
+        if (i, j) not in self._tiles:
+            self._tiles[i, j] = Tile(
+                Point(i * BLOCK_SIZE, j * BLOCK_SIZE), self._grid[j][i]
+            )
+        return self._tiles[i, j]
 
-    def tile_state(self, x, y) -> Iterable[Property]:
-        return self._tiles[(x, y)]
 
+class Camera:
+    """Window onto the map that scrolls to follow the player.
+
+    :param map_width: Map width in cells
+    :type map_width: int
+    :param map_height: Map height in cells
+    :type map_height: int
+    :param cols: Viewport width in cells
+    :type cols: int
+    :param rows: Viewport height in cells
+    :type rows: int
+    """
+
+    def __init__(
+        self,
+        map_width: int,
+        map_height: int,
+        cols: int = X_TILE_COUNT,
+        rows: int = Y_TILE_COUNT,
+    ):
+        self._map_width = map_width
+        self._map_height = map_height
+        self._cols = min(cols, map_width)
+        self._rows = min(rows, map_height)
+        self._x = 0
+        self._y = 0
+
+    @staticmethod
+    def _scroll(origin: int, pos: int, size: int, limit: int) -> int:
+        margin = min(CAMERA_MARGIN, (size - 1) // 2)
+        if pos < origin + margin:
+            origin = pos - margin
+        elif pos > origin + size - 1 - margin:
+            origin = pos - size + 1 + margin
+        return max(0, min(origin, limit - size))
+
+    def follow(self, pos: Point) -> bool:
+        """Scroll to keep ``pos`` away from the viewport edges.
+
+        :return: Whether the viewport moved
+        :rtype: bool
+        """
+        x = self._scroll(self._x, pos.x, self._cols, self._map_width)
+        y = self._scroll(self._y, pos.y, self._rows, self._map_height)
+        moved = (x, y) != (self._x, self._y)
+        self._x, self._y = x, y
+        return moved
+
+    def is_visible(self, i: int, j: int) -> bool:
+        return (
+            self._x <= i < self._x + self._cols and self._y <= j < self._y + self._rows
+        )
 
-def draw_background(canvas, tiles_coords):
-    for x, y in tiles_coords:
-        rect = pygame.Rect(x, y, BLOCK_SIZE, BLOCK_SIZE)
-        pygame.draw.rect(canvas, BLACK, rect, 1)
+    def visible_cells(self) -> Iterator[Tuple[int, int]]:
+        for j in range(self._y, self._y + self._rows):
+            for i in range(self._x, self._x + self._cols):
+                yield i, j
+
+    def screen_rect(self, i: int, j: int) -> pygame.Rect:
+        return pygame.Rect(
+            (i - self._x) * BLOCK_SIZE,
+            (j - self._y) * BLOCK_SIZE,
+            BLOCK_SIZE,
+            BLOCK_SIZE,
+        )
 
 
-def draw_visible_cells(canvas, seen):
-    for j in range(len(seen)):
-        for i in range(len(seen[0])):
-            if not seen[i][j]:
-                rect = pygame.Rect(
-                    j * BLOCK_SIZE, i * BLOCK_SIZE, BLOCK_SIZE, BLOCK_SIZE
-                )
-                pygame.draw.rect(canvas, BLACK, rect)
+class Renderer:
+    """Draw the map, the fog and the player, redrawing only what changed.
+
+    Cells are marked dirty when the player enters or leaves them or when
+    they are revealed, and ``flush`` redraws those cells and updates just
+    their rectangles on the display. Frames where nothing changed draw
+    nothing. Only cells inside the camera viewport are ever drawn, and the
+    whole viewport is redrawn when the camera scrolls.
+    """
+
+    def __init__(
+        self,
+        canvas: pygame.Surface,
+        map: Map,
+        seen: List[List[bool]],
+        camera: Camera,
+    ):
+        self._canvas = canvas
+        self._map = map
+        self._seen = seen
+        self._camera = camera
+        self._player: Optional[Tuple[int, int]] = None
+        self._thinking = False
+        self._dirty: Set[Tuple[int, int]] = set(camera.visible_cells())
+
+    def _mark_dirty(self, i: int, j: int) -> None:
+        if self._camera.is_visible(i, j):
+            self._dirty.add((i, j))
+
+    def reveal(self, i: int, j: int) -> None:
+        if not self._seen[j][i]:
+            self._seen[j][i] = True
+            self._mark_dirty(i, j)
+
+    def move_player(self, pos: Point) -> None:
+        if self._player != (pos.x, pos.y):
+            if self._player is not None:
+                self._mark_dirty(*self._player)
+            self._player = (pos.x, pos.y)
+            self._mark_dirty(*self._player)
+        if self._camera.follow(pos):
+            self._dirty = set(self._camera.visible_cells())
+
+    def set_thinking(self, thinking: bool) -> None:
+        """Show or hide the marker under the player while the agent decides."""
+        if thinking != self._thinking:
+            self._thinking = thinking
+            if self._player is not None:
+                self._mark_dirty(*self._player)
+
+    def _draw_cell(self, i: int, j: int) -> pygame.Rect:
+        rect = self._camera.screen_rect(i, j)
+        if not self._seen[j][i]:
+            return self._canvas.fill(BLACK, rect)
+
+        self._map.tile(i, j).draw(self._canvas, rect)
+        if self._player == (i, j):
+            sprite = player.get_rect().move(rect.x + OFFSET, rect.y + OFFSET)
+            self._canvas.blit(player, sprite)
+            if self._thinking:
+                for k in (-1, 0, 1):
+                    center = (sprite.centerx + k * OFFSET // 3, sprite.bottom + 8)
+                    pygame.draw.circle(self._canvas, BLACK, center, 4)
+        return rect
+
+    def flush(self) -> None:
+        if not self._dirty:
+            return
+        rects = [self._draw_cell(i, j) for i, j in self._dirty]
+        self._dirty.clear()
+        pygame.display.update(rects)
+
+
+class AgentWorker:
+    """Make the decisions of an agent on a background thread.
+
+    The render loop starts a decision with ``request`` and picks up where
+    the agent moved with ``poll``, so the window keeps drawing while the
+    agent thinks. The worker hands back a copy of the agent position, the
+    render loop never reads the agent while a decision is running.
+    """
+
+    def __init__(self, agent: Player):
+        self._agent = agent
+        self._requests: "queue.Queue[bool]" = queue.Queue()
+        self._results: "queue.Queue[Union[Point, Exception]]" = queue.Queue()
+        self._thinking = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def thinking(self) -> bool:
+        return self._thinking
+
+    def _run(self) -> None:
+        while self._requests.get():
+            try:
+                self._agent.update()
+                pos = self._agent.pos
+                self._results.put(Point(pos.x, pos.y))
+            except Exception as e:
+                self._results.put(e)
+
+    def request(self) -> bool:
+        """Start a decision, unless one is already running.
+
+        :return: Whether a decision was started
+        :rtype: bool
+        """
+        if self._thinking:
+            return False
+        self._thinking = True
+        self._requests.put(True)
+        return True
+
+    def poll(self) -> Optional[Point]:
+        """Position the agent moved to, if a decision finished since last call.
+
+        Exceptions raised by the agent while deciding are raised here.
+        """
+        try:
+            result = self._results.get_nowait()
+        except queue.Empty:
+            return None
+        self._thinking = False
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def stop(self) -> None:
+        self._requests.put(False)
 
 
 def process_human_input(event, pos, agent, tiles: WumpusWorld):
@@ -173,45 +382,59 @@ def process_human_input(event, pos, agent, tiles: WumpusWorld):
             agent.update(new_pos)
 
 
-def main():
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Wumpus world demo")
+    parser.add_argument(
+        "width", type=int, nargs="?", help="Play a generated world of this width"
+    )
+    parser.add_argument("height", type=int, nargs="?")
+    parser.add_argument("seed", nargs="?", help="Seed of the generated world")
+    parser.add_argument(
+        "--auto-step",
+        type=float,
+        metavar="SECONDS",
+        help="Let the agent move on its own, pausing this long between moves",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str]):
+    args = parse_args(argv)
     pygame.init()
     SCREEN = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
     clock = pygame.time.Clock()
     SCREEN.fill(WHITE)
     breeze.convert()
 
-    current_pos = Point(0, 3)
-    seen = []
-    for j in range(4):
-        row = []
-        for i in range(4):
-            if Point(i, j) == current_pos:
-                row.append(True)
-            else:
-                row.append(False)
-        seen.append(row)
-    wumpus_world = create_wumpus_world()
-    # wumpus_world = create_wumpus_world2()
+    if args.width is not None:
+        height = args.width if args.height is None else args.height
+        wumpus_world = next(generate_worlds(1, args.seed, args.width, height))
+        current_pos = Point(0, 0)
+    else:
+        wumpus_world = create_wumpus_world1()
+        # wumpus_world = create_wumpus_world2()
+        current_pos = Point(0, 3)
+    map_width = len(wumpus_world[0])
+    map_height = len(wumpus_world._grid)
+    seen = [[False] * map_width for _ in range(map_height)]
+    seen[current_pos.y][current_pos.x] = True
     # agent = HumanPlayer(current_pos)
     # agent = LogicAIPlayer(current_pos, wumpus_world, seen)
     agent = ProbabilisticAIPlayer(current_pos, wumpus_world)
 
-    map = Map.from_list(wumpus_world)
-    rect = player.get_rect()
-    rect.center = (
-        rect.center[0] + OFFSET + agent.pos.x * BLOCK_SIZE,
-        rect.center[1] + OFFSET + agent.pos.y * BLOCK_SIZE,
-    )
-    SCREEN.blit(player, rect)
-    draw_background(SCREEN, map.get_tiles_coords())
+    map = Map.from_list(wumpus_world._grid)
+    renderer = Renderer(SCREEN, map, seen, Camera(map_width, map_height))
     Pan3 = Pane()
 
+    worker = None if isinstance(agent, HumanPlayer) else AgentWorker(agent)
+    pos = Point(current_pos.x, current_pos.y)
+    last_move = time.monotonic()
     while True:
 
         if (
-            Property.GOLD in wumpus_world[agent.pos.y][agent.pos.x]
-            or Property.PIT in wumpus_world[agent.pos.y][agent.pos.x]
-            or Property.WUMPUS in wumpus_world[agent.pos.y][agent.pos.x]
+            wumpus_world.has(pos.x, pos.y, Property.GOLD)
+            or wumpus_world.has(pos.x, pos.y, Property.PIT)
+            or wumpus_world.has(pos.x, pos.y, Property.WUMPUS)
         ):
             break
         for event in pygame.event.get():
@@ -219,35 +442,43 @@ def main():
                 pygame.quit()
                 sys.exit()
 
-            pos = agent.pos
-            if isinstance(agent, HumanPlayer):
-                process_human_input(event, pos, agent, wumpus_world)
-            else:
-                if event.type == pygame.KEYDOWN:
-                    agent.update()
-                    seen[agent.pos.y][agent.pos.x] = True
-                    time.sleep(1)
-
-        new_pos = agent.pos
-        if current_pos != agent.pos:
-            seen[new_pos.y][new_pos.x] = True
-            if wumpus_world[current_pos.y][current_pos.x]:
-                wumpus_world[current_pos.y][current_pos.x].remove(Property.PLAYER)
-
-            wumpus_world[new_pos.y][new_pos.x].add(Property.PLAYER)
-
-        SCREEN.fill(WHITE)
-        rect = player.get_rect()
-        position = rect.move(
-            OFFSET + agent.pos.x * BLOCK_SIZE, OFFSET + agent.pos.y * BLOCK_SIZE
-        )
-        SCREEN.blit(player, position)
-        map.draw(SCREEN)
-        draw_visible_cells(SCREEN, seen)
-        draw_background(SCREEN, map.get_tiles_coords())
-        pygame.display.update()
+            if worker is None:
+                process_human_input(event, agent.pos, agent, wumpus_world)
+            elif event.type == pygame.KEYDOWN:
+                worker.request()
 
-        clock.tick(60)
+        if worker is None:
+            pos = agent.pos
+        else:
+            if (
+                args.auto_step is not None
+                and time.monotonic() - last_move >= args.auto_step
+            ):
+                worker.request()
+            new_pos = worker.poll()
+            if new_pos is not None:
+                pos = new_pos
+                last_move = time.monotonic()
+            renderer.set_thinking(worker.thinking)
+
+        renderer.reveal(pos.x, pos.y)
+        renderer.move_player(pos)
+        renderer.flush()
+
+        clock.tick(FPS)
+
+    if worker is not None:
+        worker.stop()
+    renderer.set_thinking(False)
+    renderer.reveal(pos.x, pos.y)
+    renderer.move_player(pos)
+    renderer.flush()
+    Pan3.add_rect(SCREEN)
+    if wumpus_world.has(pos.x, pos.y, Property.GOLD):
+        Pan3.add_text(SCREEN, "You won")
+    else:
+        Pan3.add_text(SCREEN, "You lost")
+    pygame.display.update()
 
     waiting = True
     while waiting:
@@ -259,21 +490,8 @@ def main():
             if event.type == pygame.KEYDOWN:
                 waiting = False
 
-        SCREEN.fill(WHITE)
-        rect = player.get_rect()
-        position = rect.move(
-            OFFSET + agent.pos.x * BLOCK_SIZE, OFFSET + agent.pos.y * BLOCK_SIZE
-        )
-        SCREEN.blit(player, position)
-        map.draw(SCREEN)
-        draw_visible_cells(SCREEN, seen)
-        draw_background(SCREEN, map.get_tiles_coords())
-        Pan3.add_rect(SCREEN)
-        if Property.GOLD in wumpus_world[agent.pos.y][agent.pos.x]:
-            Pan3.add_text(SCREEN, "You won")
-        else:
-            Pan3.add_text(SCREEN, "You lost")
-        pygame.display.update()
+        clock.tick(FPS)
 
 
-main()
+if __name__ == "__main__":
+    main(sys.argv[1:])
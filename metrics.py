@@ -0,0 +1,106 @@
+import time
+from typing import Callable, Dict, List, Optional
+
+# Phases of an agent decision
+PERCEIVE = "perceive"
+FRINGE_UPDATE = "fringe_update"
+INFERENCE = "inference"
+PLANNING = "planning"
+PHASES = (PERCEIVE, FRINGE_UPDATE, INFERENCE, PLANNING)
+
+
+class DecisionMetrics:
+    """Time spent in each phase of a single decision and work counters.
+
+    Counters are only present once incremented, e.g. ``kb_queries`` for the
+    logic agent, ``events_enumerated`` and ``consistent_events`` for the
+    probabilistic one.
+    """
+
+    def __init__(self) -> None:
+        self._timings = dict.fromkeys(PHASES, 0.0)
+        self._counts: Dict[str, int] = {}
+
+    @property
+    def timings(self) -> Dict[str, float]:
+        return self._timings
+
+    @property
+    def counts(self) -> Dict[str, int]:
+        return self._counts
+
+    @property
+    def total_time(self) -> float:
+        return sum(self._timings.values())
+
+    def __repr__(self) -> str:
+        return f"DecisionMetrics(timings={self._timings}, counts={self._counts})"
+
+
+class MetricsRecorder:
+    """Collects the metrics of every decision an agent makes.
+
+    Agents charge elapsed time to a phase with ``lap``: the time since the
+    previous lap (or the start of the decision) goes to the given phase.
+    Laps and counts outside a decision, e.g. from agent helpers called
+    directly, are ignored.
+
+    :param callback: Called with the metrics of each decision once it is made
+    :type callback: Optional[Callable[[DecisionMetrics], None]]
+    :param keep_history: Whether to keep the metrics of every decision
+    :type keep_history: bool
+    """
+
+    def __init__(
+        self,
+        callback: Optional[Callable[[DecisionMetrics], None]] = None,
+        keep_history: bool = True,
+    ) -> None:
+        self._callback = callback
+        self._keep_history = keep_history
+        self._history: List[DecisionMetrics] = []
+        self._current: Optional[DecisionMetrics] = None
+        self._last = 0.0
+
+    @property
+    def history(self) -> List[DecisionMetrics]:
+        return self._history
+
+    @property
+    def current(self) -> Optional[DecisionMetrics]:
+        return self._current
+
+    def start_decision(self) -> None:
+        self._current = DecisionMetrics()
+        self._last = time.perf_counter()
+
+    def lap(self, phase: str) -> None:
+        if self._current is None:
+            return
+        now = time.perf_counter()
+        self._current.timings[phase] += now - self._last
+        self._last = now
+
+    def count(self, name: str, n: int = 1) -> None:
+        if self._current is None:
+            return
+        counts = self._current.counts
+        counts[name] = counts.get(name, 0) + n
+
+    def end_decision(self) -> None:
+        metrics = self._current
+        self._current = None
+        if self._keep_history:
+            self._history.append(metrics)
+        if self._callback is not None:
+            self._callback(metrics)
+
+    def totals(self) -> DecisionMetrics:
+        """Timings and counters summed over the decision history."""
+        totals = DecisionMetrics()
+        for metrics in self._history:
+            for phase, seconds in metrics.timings.items():
+                totals.timings[phase] += seconds
+            for name, n in metrics.counts.items():
+                totals.counts[name] = totals.counts.get(name, 0) + n
+        return totals
@@ -1,11 +1,11 @@
 from abc import abstractmethod
 from enum import Enum
+import itertools
 import pickle
 import random
-from typing import Optional, Tuple
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
 from consts import Property
 from pylogic.propositional import (
-    Variable,
     CnfClause,
     DpllKB,
     ResolutionKB,
@@ -13,16 +13,172 @@ from pylogic.propositional import (
     CnfParser,
     to_cnf,
 )
-from inference import probability
+from inference import bitmask, probability
+from metrics import FRINGE_UPDATE, INFERENCE, PERCEIVE, PLANNING, MetricsRecorder
 
 import os
 
-from wumpus import WumpusWorld, create_wumpus_world1, create_wumpus_world2, WumpusWorldGenerator
+from wumpus import (
+    ENCODING_VERSION,
+    WumpusWorld,
+    create_wumpus_world1,
+    create_wumpus_world2,
+    WumpusWorldGenerator,
+)
 
 os.environ["PYGAME_HIDE_SUPPORT_PROMPT"] = "hide"
-import pygame
 
-from utils import Point, ShortestPathSearchProblem, a_star_route, manhattan_heuristic
+from utils import DistanceFieldPlanner, Point
+
+# Prior probability of an unexplored cell holding a pit or the wumpus
+UNSAFE_PRIOR = 0.2
+
+CNF_CACHE_DIR = os.environ.get(
+    "WUMPUS_CNF_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "wumpus-ai")
+)
+
+
+# Breeze/stench rules are cached on disk in square blocks of this many cells
+# per side, so an agent only reads the blocks around the cells it visits
+CNF_SHARD_SIZE = 16
+
+# CNF rules converted in this process, keyed by grid width, height and
+# ENCODING_VERSION, and shared by every agent playing a grid of that size
+_cell_rules: Dict[Tuple[int, int, int], Dict[Tuple[int, int], List[Any]]] = {}
+_loaded_shards: Dict[Tuple[int, int, int], Set[Tuple[int, int]]] = {}
+_exactly_one_rules: Dict[Tuple[int, int, int], List[Any]] = {}
+
+
+def _grid_key(wumpus_world: WumpusWorld) -> Tuple[int, int, int]:
+    return len(wumpus_world[0]), len(wumpus_world._grid), ENCODING_VERSION
+
+
+def _cache_path(cache_dir: str, key: Tuple[int, int, int], name: str) -> str:
+    map_width, map_height, version = key
+    grid_dir = f"cnf_rules_v{version}_{map_width}x{map_height}"
+    return os.path.join(cache_dir, grid_dir, f"{name}.pkl")
+
+
+def _read_cache(path: str) -> Optional[Any]:
+    try:
+        with open(path, "rb") as f:
+            return pickle.load(f)
+    # Unpickling raises AttributeError or ImportError when the pylogic
+    # classes changed, which ENCODING_VERSION does not account for
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+        return None
+
+
+def _write_cache(path: str, data: Any) -> None:
+    # Caching is best effort: an unwritable cache directory only means the
+    # rules are built again by the next process
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename, so concurrent agents never read a partial file
+        with open(tmp_path, "wb") as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except (OSError, pickle.PicklingError, RecursionError):
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+
+def build_cnf_rules(
+    wumpus_world: WumpusWorld, cells: Iterable[Tuple[int, int]]
+) -> Dict[Tuple[int, int], List[Any]]:
+    """Convert the breeze/stench rules of some cells to CNF.
+
+    The rules only depend on the grid dimensions, not on its contents.
+
+    :param wumpus_world: World whose grid size the rules are built for
+    :type wumpus_world: WumpusWorld
+    :param cells: Cells to convert the rules of
+    :type cells: Iterable[Tuple[int, int]]
+    :return: CNF clauses keyed by cell
+    :rtype: Dict[Tuple[int, int], List[Any]]
+    """
+    return {
+        (x, y): [to_cnf(clause) for clause in wumpus_world._breeze_stench_rule(x, y)]
+        for x, y in cells
+    }
+
+
+def load_cnf_rules(
+    wumpus_world: WumpusWorld, x: int, y: int, cache_dir: Optional[str] = CNF_CACHE_DIR
+) -> List[Any]:
+    """CNF breeze/stench rules of a cell, converted once per process.
+
+    On a miss the block of ``CNF_SHARD_SIZE`` cells per side around the cell
+    is read from ``cache_dir``, or built and written there. Cache files are
+    keyed by grid dimensions and ``ENCODING_VERSION``, so a change in how
+    rules are generated never reads stale rules.
+
+    :param wumpus_world: World whose grid size the rules are built for
+    :type wumpus_world: WumpusWorld
+    :param x: Column of the cell
+    :type x: int
+    :param y: Row of the cell
+    :type y: int
+    :param cache_dir: Cache directory, or None to only cache in memory
+    :type cache_dir: Optional[str]
+    :return: CNF clauses of the cell
+    :rtype: List[Any]
+    """
+    key = _grid_key(wumpus_world)
+    rules = _cell_rules.setdefault(key, {})
+    if (x, y) in rules:
+        return rules[x, y]
+    if cache_dir is None:
+        rules.update(build_cnf_rules(wumpus_world, [(x, y)]))
+        return rules[x, y]
+
+    shard = (x // CNF_SHARD_SIZE, y // CNF_SHARD_SIZE)
+    loaded = _loaded_shards.setdefault(key, set())
+    if shard not in loaded:
+        loaded.add(shard)
+        path = _cache_path(cache_dir, key, f"shard_{shard[0]}_{shard[1]}")
+        shard_rules = _read_cache(path)
+        if shard_rules is None:
+            map_width, map_height, _ = key
+            x0, y0 = shard[0] * CNF_SHARD_SIZE, shard[1] * CNF_SHARD_SIZE
+            cells = itertools.product(
+                range(x0, min(x0 + CNF_SHARD_SIZE, map_width)),
+                range(y0, min(y0 + CNF_SHARD_SIZE, map_height)),
+            )
+            shard_rules = build_cnf_rules(wumpus_world, cells)
+            _write_cache(path, shard_rules)
+        for cell, clauses in shard_rules.items():
+            rules.setdefault(cell, clauses)
+    if (x, y) not in rules:
+        rules.update(build_cnf_rules(wumpus_world, [(x, y)]))
+    return rules[x, y]
+
+
+def load_exactly_one_wumpus_rules(
+    wumpus_world: WumpusWorld, cache_dir: Optional[str] = CNF_CACHE_DIR
+) -> List[Any]:
+    """CNF clauses stating there is exactly one wumpus, converted once.
+
+    :param wumpus_world: World whose grid size the rules are built for
+    :type wumpus_world: WumpusWorld
+    :param cache_dir: Cache directory, or None to only cache in memory
+    :type cache_dir: Optional[str]
+    :return: CNF clauses of the exactly-one-wumpus rule
+    :rtype: List[Any]
+    """
+    key = _grid_key(wumpus_world)
+    if key not in _exactly_one_rules:
+        path = None if cache_dir is None else _cache_path(cache_dir, key, "exactly_one")
+        rules = None if path is None else _read_cache(path)
+        if rules is None:
+            rules = [to_cnf(clause) for clause in wumpus_world._exactly_one_wumpus()]
+            if path is not None:
+                _write_cache(path, rules)
+        _exactly_one_rules[key] = rules
+    return _exactly_one_rules[key]
 
 
 class Direction(Enum):
@@ -37,27 +193,49 @@ class NoAvailableSafeTiles(Exception):
 
 
 class Player:
-    def __init__(self, pos: Point):
+    def __init__(self, pos: Point, metrics: Optional[MetricsRecorder] = None):
         self._pos = pos
+        self._metrics = metrics
 
     @property
     def pos(self) -> Point:
         return self._pos
 
+    @property
+    def metrics(self) -> Optional[MetricsRecorder]:
+        """Per-decision timings and counters, None when not instrumented."""
+        return self._metrics
+
+    def _lap(self, phase: str) -> None:
+        if self._metrics is not None:
+            self._metrics.lap(phase)
+
+    def _count(self, name: str, n: int = 1) -> None:
+        if self._metrics is not None:
+            self._metrics.count(name, n)
+
     @abstractmethod
     def update(self) -> None:
         raise NotImplemented()
 
     def draw(self, canvas, rect, color) -> None:
+        # Imported here so agents can run headless without pygame
+        import pygame
+
         pygame.draw.rect(canvas, color, rect, 1)
 
 
 class LogicAIPlayer(Player):
-    def __init__(self, pos: Point, wumpus_world: WumpusWorld, kb_type="dpll") -> None:
-        Player.__init__(
-            self,
-            pos,
-        )
+    def __init__(
+        self,
+        pos: Point,
+        wumpus_world: WumpusWorld,
+        kb_type="dpll",
+        exactly_one_wumpus=False,
+        cnf_cache_dir: Optional[str] = CNF_CACHE_DIR,
+        metrics: Optional[MetricsRecorder] = None,
+    ) -> None:
+        Player.__init__(self, pos, metrics)
         self._pos = pos
         self._kb = DpllKB()
         self._visited = []
@@ -65,17 +243,37 @@ class LogicAIPlayer(Player):
             self._visited.append([False] * len(wumpus_world[0]))
 
         self._wumpus_world = wumpus_world
+        self._symbols = wumpus_world.symbols
         self._fringe = set()
         self._plan = []
-        self._kb.add(Variable(f"W{pos.x}{pos.y}", True))
-        self._kb.add(Variable(f"P{pos.x}{pos.y}", True))
-        self._breeze_stench_rules = wumpus_world._breeze_stench_rules()
-        for y in range(len(self._visited)):
-            for x in range(len(self._visited[y])):
-                for clause in self._breeze_stench_rules["B", Point(x, y)]:
-                    self._kb.add(clause)
-                for clause in self._breeze_stench_rules["S", Point(x, y)]:
-                    self._kb.add(clause)
+        self._planner = DistanceFieldPlanner(self._visited, pos)
+        self._kb.add(self._symbols.variable("W", pos.x, pos.y, is_negated=True))
+        self._kb.add(self._symbols.variable("P", pos.x, pos.y, is_negated=True))
+        # Rules are only loaded once the cell percepts are known, as a rule
+        # for a cell with unknown percepts does not entail anything
+        self._loaded_rules = set()
+        # Entailed facts stay entailed as the KB grows, so proofs are kept
+        # for the whole game. Cells that could not be proven safe are only
+        # queried again once a percept next to them is added.
+        self._proven_no_pit = set()
+        self._proven_no_wumpus = set()
+        self._unproven = set()
+        # Pits and wumpuses pinned down by unit propagation on the percepts
+        self._proven_pit = set()
+        self._proven_wumpus = set()
+        self._percepts = {}
+        self._stats = {"queries": 0, "queries_avoided": 0}
+        self._exactly_one_wumpus = exactly_one_wumpus
+        self._cnf_cache_dir = cnf_cache_dir
+        if exactly_one_wumpus:
+            for clause in load_exactly_one_wumpus_rules(wumpus_world, cnf_cache_dir):
+                self._kb.add(clause)
+
+    def _adjacent_positions(self, x, y):
+        for dx, dy in ((0, 1), (1, 0), (0, -1), (-1, 0)):
+            xa, ya = x + dx, y + dy
+            if 0 <= xa < len(self._visited[0]) and 0 <= ya < len(self._visited):
+                yield xa, ya
 
     def _is_adjacent(self, x1, y1, x2, y2) -> bool:
         return (
@@ -90,15 +288,24 @@ class LogicAIPlayer(Player):
             or (x1 == x2 and y1 == y2)
         )
 
+    @property
+    def stats(self):
+        """DPLL queries run and avoided during the last step."""
+        return self._stats
+
     def _pl_wumpus_agent(self) -> Direction:
         x, y = self.pos.x, self.pos.y
+        self._stats = {"queries": 0, "queries_avoided": 0}
         self._perceive()
-        self._visited[y][x] = True
+        self._planner.mark_visited(x, y)
+        self._lap(PERCEIVE)
         self._update_fringe()
+        self._lap(FRINGE_UPDATE)
 
-        if "W" in self._wumpus_world[y][x] or "P" in self._wumpus_world[y][x]:
+        world = self._wumpus_world
+        if world.has(x, y, Property.WUMPUS) or world.has(x, y, Property.PIT):
             raise Exception("YOU DIED!")
-        elif "G" in self._wumpus_world[y][x]:
+        elif world.has(x, y, Property.GOLD):
             raise Exception("YOU WON!")
 
         if len(self._plan):
@@ -111,13 +318,14 @@ class LogicAIPlayer(Player):
                 action = Direction.LEFT
             else:
                 action = Direction.RIGHT
+            self._lap(PLANNING)
             yield action
         else:
             safe_pos = self._get_safe_pos()
+            self._lap(INFERENCE)
             if safe_pos is not None:
-                self._plan = a_star_route(
-                    ShortestPathSearchProblem(self.pos, safe_pos, self._visited)
-                )
+                self._planner.set_root(self.pos)
+                self._plan = self._planner.route(safe_pos)
 
                 action = self._plan.pop(0)
                 if action == "up":
@@ -128,28 +336,70 @@ class LogicAIPlayer(Player):
                     action = Direction.LEFT
                 else:
                     action = Direction.RIGHT
+                self._lap(PLANNING)
                 yield action
 
-        yield self._random_move()
+        action = self._random_move()
+        self._lap(PLANNING)
+        yield action
 
     def _check_if_no_pit(self, i, j) -> bool:
-        p = Variable(f"P{i}{j}", is_negated=False, truthyness=None)
+        self._stats["queries"] += 1
+        self._count("kb_queries")
+        p = self._symbols.variable("P", i, j)
         return self._kb.query(~p)
 
     def _check_if_no_wumpus(self, i, j) -> bool:
-        w = Variable(f"W{i}{j}", is_negated=False, truthyness=None)
+        self._stats["queries"] += 1
+        self._count("kb_queries")
+        w = self._symbols.variable("W", i, j)
 
         return self._kb.query(~w)
 
+    def _wumpus_found_elsewhere(self, i, j) -> bool:
+        return (
+            self._exactly_one_wumpus
+            and len(self._proven_wumpus) > 0
+            and (i, j) not in self._proven_wumpus
+        )
+
+    def _is_safe(self, i, j) -> bool:
+        if (i, j) in self._proven_no_pit:
+            self._stats["queries_avoided"] += 1
+            self._count("kb_queries_avoided")
+        else:
+            if not self._check_if_no_pit(i, j):
+                return False
+            self._proven_no_pit.add((i, j))
+        if (i, j) in self._proven_no_wumpus or self._wumpus_found_elsewhere(i, j):
+            self._stats["queries_avoided"] += 1
+            self._count("kb_queries_avoided")
+        else:
+            if not self._check_if_no_wumpus(i, j):
+                return False
+            self._proven_no_wumpus.add((i, j))
+        return True
+
     def _get_safe_pos(self) -> Optional[Point]:
-        for i, j in self._fringe:
-            if self._check_if_no_pit(i, j) and self._check_if_no_wumpus(i, j):
+        # Safety is tested nearest first, so the search stops at the closest
+        # safe cell instead of querying the whole fringe
+        self._planner.set_root(self.pos)
+        for i, j in self._planner.frontier():
+            if (i, j) not in self._fringe:
+                continue
+            if (i, j) in self._proven_pit or (i, j) in self._proven_wumpus:
+                self._stats["queries_avoided"] += 1
+                self._count("kb_queries_avoided")
+                continue
+            if (i, j) in self._unproven:
+                continue
+            if self._is_safe(i, j):
                 return Point(i, j)
+            self._unproven.add((i, j))
 
         return None
 
     def _random_move(self) -> Direction:
-        print("RANDOM")
         x, y = self.pos.x, self.pos.y
         choices = []
         if x > 0 and not self._visited[y][x - 1]:
@@ -186,20 +436,87 @@ class LogicAIPlayer(Player):
             and y <= len(self._wumpus_world._grid) - 1
         )
 
+    def _load_rules(self, x, y) -> None:
+        if (x, y) in self._loaded_rules:
+            return
+        self._loaded_rules.add((x, y))
+        for clause in load_cnf_rules(self._wumpus_world, x, y, self._cnf_cache_dir):
+            self._kb.add(clause)
+
+    def _unit_propagate(self, x, y) -> None:
+        """Derive pit and wumpus literals implied by the percepts.
+
+        A cell without breeze (stench) clears all its neighbours of pits
+        (the wumpus), and a cell with breeze (stench) whose neighbours are
+        all cleared but one pins a pit (the wumpus) there. Each derived
+        literal only revisits the percepts around the cell it is about, so
+        the pass is linear in the number of literals derived.
+        """
+        # Clearing (x, y) may pin down a hazard next to its perceived neighbours
+        queue = [(x, y)]
+        queue.extend(n for n in self._adjacent_positions(x, y) if n in self._percepts)
+        while queue:
+            cx, cy = queue.pop()
+            breeze, stench = self._percepts[cx, cy]
+            for felt, cleared, pinned in (
+                (breeze, self._proven_no_pit, self._proven_pit),
+                (stench, self._proven_no_wumpus, self._proven_wumpus),
+            ):
+                neighbours = list(self._adjacent_positions(cx, cy))
+                if not felt:
+                    for pos in neighbours:
+                        if pos not in cleared:
+                            cleared.add(pos)
+                            queue.extend(
+                                n
+                                for n in self._adjacent_positions(*pos)
+                                if n in self._percepts
+                            )
+                    continue
+
+                candidates = [pos for pos in neighbours if pos not in cleared]
+                if len(candidates) == 1:
+                    pinned.add(candidates[0])
+
     def _perceive(self):
         x, y = self.pos.x, self.pos.y
-        if "S" in self._wumpus_world[y][x]:
-            self._kb.add(Variable(f"S{x}{y}", is_negated=False, truthyness=None))
+        if (x, y) in self._percepts:
+            return
+
+        self._load_rules(x, y)
+        if self._exactly_one_wumpus:
+            # Locating the wumpus anywhere clears every other cell
+            self._unproven.clear()
+        for pos in self._adjacent_positions(x, y):
+            self._unproven.discard(pos)
+        # The agent is standing here, so the cell is safe
+        self._kb.add(self._symbols.variable("W", x, y, is_negated=True))
+        self._kb.add(self._symbols.variable("P", x, y, is_negated=True))
+        stench = self._wumpus_world.has(x, y, Property.STENCH)
+        if stench:
+            self._kb.add(self._symbols.variable("S", x, y))
         else:
-            self._kb.add(Variable(f"S{x}{y}", is_negated=True, truthyness=None))
+            self._kb.add(self._symbols.variable("S", x, y, is_negated=True))
 
-        if "B" in self._wumpus_world[y][x]:
-            self._kb.add(Variable(f"B{x}{y}", is_negated=False, truthyness=None))
+        breeze = self._wumpus_world.has(x, y, Property.BREEZE)
+        if breeze:
+            self._kb.add(self._symbols.variable("B", x, y))
         else:
-            self._kb.add(Variable(f"B{x}{y}", is_negated=True, truthyness=None))
+            self._kb.add(self._symbols.variable("B", x, y, is_negated=True))
+
+        self._proven_no_pit.add((x, y))
+        self._proven_no_wumpus.add((x, y))
+        self._percepts[x, y] = (breeze, stench)
+        self._unit_propagate(x, y)
 
     def update(self):
-        action = next(self._pl_wumpus_agent())
+        if self._metrics is not None:
+            self._metrics.start_decision()
+        try:
+            action = next(self._pl_wumpus_agent())
+        finally:
+            if self._metrics is not None:
+                self._metrics.end_decision()
         pos = self.pos
         if action == Direction.UP:
             new_pos = Point(pos.x, pos.y - 1)
@@ -224,8 +541,16 @@ class HumanPlayer(Player):
 
 
 class ProbabilisticAIPlayer(Player):
-    def __init__(self, pos: Point, wumpus_world: WumpusWorld):
-        Player.__init__(self, pos)
+    def __init__(
+        self,
+        pos: Point,
+        wumpus_world: WumpusWorld,
+        engine="enumeration",
+        metrics: Optional[MetricsRecorder] = None,
+    ):
+        Player.__init__(self, pos, metrics)
+        if engine not in ("enumeration", "bitmask"):
+            raise ValueError(f"Unknown inference engine: {engine}")
 
         self._visited = []
         for _ in range(len(wumpus_world._grid)):
@@ -233,9 +558,11 @@ class ProbabilisticAIPlayer(Player):
 
         self._wumpus_world = wumpus_world
         self._plan = []
+        self._planner = DistanceFieldPlanner(self._visited, pos)
         self._fringe = set()
         self._evidence_breeze_stench = {}
         self._known_pit_wumpus = {}
+        self._engine = engine
 
     def _is_valid_pos(self, x, y) -> bool:
         return (
@@ -253,7 +580,8 @@ class ProbabilisticAIPlayer(Player):
 
     def _perceive(self):
         x, y = self.pos.x, self.pos.y
-        if Property.STENCH in self._wumpus_world[y][x] or Property.BREEZE in self._wumpus_world[y][x]:
+        world = self._wumpus_world
+        if world.has(x, y, Property.STENCH) or world.has(x, y, Property.BREEZE):
             self._evidence_breeze_stench[(x, y)] = True
         else:
             self._known_pit_wumpus[(x, y)] = False
@@ -265,10 +593,12 @@ class ProbabilisticAIPlayer(Player):
 
     def _probabilistic_agent(self):
         x, y = self.pos.x, self.pos.y
-        self._visited[y][x] = True
+        self._planner.mark_visited(x, y)
         self._perceive()
+        self._lap(PERCEIVE)
         if (x, y) in self._fringe:
             self._fringe.remove((x, y))
+        self._lap(FRINGE_UPDATE)
         if len(self._plan):
             action = self._plan.pop(0)
             if action == "up":
@@ -279,13 +609,14 @@ class ProbabilisticAIPlayer(Player):
                 action = Direction.LEFT
             else:
                 action = Direction.RIGHT
+            self._lap(PLANNING)
             yield action
         else:
             safe_pos = self._get_safe_pos()
+            self._lap(INFERENCE)
             if safe_pos is not None:
-                self._plan = a_star_route(
-                    ShortestPathSearchProblem(self.pos, safe_pos, self._visited)
-                )
+                self._planner.set_root(self.pos)
+                self._plan = self._planner.route(safe_pos)
 
                 action = self._plan.pop(0)
                 if action == "up":
@@ -296,6 +627,7 @@ class ProbabilisticAIPlayer(Player):
                     action = Direction.LEFT
                 else:
                     action = Direction.RIGHT
+                self._lap(PLANNING)
                 yield action
 
     def _has_surrounding_pits_wumpus(self, event, x, y):
@@ -307,8 +639,10 @@ class ProbabilisticAIPlayer(Player):
                 return True
         return False
 
-    def _consistent(self, event) -> bool:
-        for x, y in self._evidence_breeze_stench:
+    def _consistent(self, event, evidence=None) -> bool:
+        if evidence is None:
+            evidence = self._evidence_breeze_stench
+        for x, y in evidence:
             # has breeze or stench but has no surrounding pit or wumpus
             if self._evidence_breeze_stench[
                 (x, y)
@@ -321,42 +655,178 @@ class ProbabilisticAIPlayer(Player):
                 return False
         return True
 
+    def _fringe_components(
+        self,
+    ) -> List[Tuple[Set[Tuple[int, int]], Set[Tuple[int, int]]]]:
+        """Split the fringe into groups coupled through breeze/stench evidence.
+
+        Two fringe cells end up in the same component when they are connected
+        through percepts of visited cells, as only then can the value of one
+        change the probability of the other. A fringe cell next to no evidence
+        forms a component of its own with an empty evidence set.
+
+        :return: Pairs of fringe cells and the evidence cells constraining them
+        :rtype: List[Tuple[Set[Tuple[int, int]], Set[Tuple[int, int]]]]
+        """
+        components = []
+        unassigned = set(self._fringe)
+        while unassigned:
+            start = unassigned.pop()
+            cells = {start}
+            evidence = set()
+            stack = [start]
+            while stack:
+                x, y = stack.pop()
+                for pos in self._adjacent_positions(x, y):
+                    if pos not in self._evidence_breeze_stench or pos in evidence:
+                        continue
+                    evidence.add(pos)
+                    for neighbour in self._adjacent_positions(*pos):
+                        if neighbour in unassigned:
+                            unassigned.remove(neighbour)
+                            cells.add(neighbour)
+                            stack.append(neighbour)
+            components.append((cells, evidence))
+        return components
+
+    def _event_prior(self, event) -> float:
+        prob = 1
+        for val in event.values():
+            if val:
+                prob *= UNSAFE_PRIOR
+            else:
+                prob *= 1 - UNSAFE_PRIOR
+        return prob
+
     def _ask_probability_unsafe(self, x, y) -> float:
+        """Probability of (x, y) holding a pit or the wumpus given the percepts.
+
+        Only the fringe component containing (x, y) is enumerated, the rest of
+        the fringe is independent of it given the evidence.
+
+        :param x: Column of the fringe cell
+        :param y: Row of the fringe cell
+        :return: Posterior probability of the cell being unsafe, 0 for a
+            visited cell
+        :rtype: float
+        :raises ValueError: If (x, y) is neither visited nor in the fringe
+        """
+        if self._visited[y][x]:
+            return 0.0
+        for cells, evidence in self._fringe_components():
+            if (x, y) in cells:
+                break
+        else:
+            raise ValueError(f"({x}, {y}) is not in the fringe")
+        if not evidence:
+            return UNSAFE_PRIOR
+
         vars = [
             probability.Variable((xf, yf), [True, False])
-            for (xf, yf) in self._fringe
+            for (xf, yf) in cells
             if (xf, yf) != (x, y)
         ]
         jpd = probability.JointDistribution()
-        fringe_prob = 0
         unknown = probability.Variable((x, y), [True, False])
-        evidence = {unknown: True}
-        for event in jpd.all_events(vars, evidence):
-            prob = 1
-            for (pos, val) in event.items():
-                if pos != unknown:
-                    if val:
-                        prob *= 0.2
-                    else:
-                        prob *= 0.8
-            event_ = event.copy()
-            event_.update(evidence)
-            if self._consistent(event_):
-                fringe_prob += prob
-        return fringe_prob
+        mass = {True: 0, False: 0}
+        n_events = n_consistent = 0
+        for value in unknown:
+            for event in jpd.all_events(vars, {unknown: value}):
+                n_events += 1
+                if self._consistent(event, evidence):
+                    n_consistent += 1
+                    mass[value] += self._event_prior(event)
+        self._count("events_enumerated", n_events)
+        self._count("consistent_events", n_consistent)
+
+        total = mass[True] + mass[False]
+        if total == 0:
+            return UNSAFE_PRIOR
+        return mass[True] / total
+
+    def _fringe_risk(self) -> Dict[Tuple[int, int], float]:
+        """Probability of every fringe cell being unsafe given the percepts.
+
+        Each fringe component is enumerated once, accumulating the mass of the
+        consistent events where each of its cells is unsafe, instead of
+        enumerating the component again for every cell in it.
+
+        :return: Posterior probability of being unsafe, keyed by fringe cell
+        :rtype: Dict[Tuple[int, int], float]
+        """
+        risk = {}
+        for cells, evidence in self._fringe_components():
+            if not evidence:
+                for pos in cells:
+                    risk[pos] = UNSAFE_PRIOR
+            elif self._engine == "bitmask":
+                risk.update(self._component_risk_bitmask(cells, evidence))
+            else:
+                risk.update(self._component_risk_enumeration(cells, evidence))
+        return risk
+
+    def _component_risk_enumeration(
+        self, cells: Set[Tuple[int, int]], evidence: Set[Tuple[int, int]]
+    ) -> Dict[Tuple[int, int], float]:
+        jpd = probability.JointDistribution()
+        vars = [probability.Variable(pos, [True, False]) for pos in cells]
+        total = 0
+        unsafe_mass = {var: 0 for var in vars}
+        n_events = n_consistent = 0
+        for event in jpd.all_events(vars, {}):
+            n_events += 1
+            if not self._consistent(event, evidence):
+                continue
+            n_consistent += 1
+            prob = self._event_prior(event)
+            total += prob
+            for var, val in event.items():
+                if val:
+                    unsafe_mass[var] += prob
+        self._count("events_enumerated", n_events)
+        self._count("consistent_events", n_consistent)
+
+        return {
+            var.name: unsafe_mass[var] / total if total else UNSAFE_PRIOR
+            for var in vars
+        }
+
+    def _component_risk_bitmask(
+        self, cells: Set[Tuple[int, int]], evidence: Set[Tuple[int, int]]
+    ) -> Dict[Tuple[int, int], float]:
+        positions = list(cells)
+        bit = {pos: 1 << i for i, pos in enumerate(positions)}
+        constraints = []
+        for x, y in evidence:
+            mask = 0
+            for pos in self._adjacent_positions(x, y):
+                mask |= bit.get(pos, 0)
+            constraints.append((mask, self._evidence_breeze_stench[(x, y)]))
+
+        probs, n_consistent = bitmask.unsafe_marginals(
+            len(positions), constraints, UNSAFE_PRIOR, return_consistent=True
+        )
+        self._count("events_enumerated", 1 << len(positions))
+        self._count("consistent_events", n_consistent)
+        return {pos: float(prob) for pos, prob in zip(positions, probs)}
 
     def _get_safe_pos(self) -> Optional[Point]:
         risky_prob = 2
         next_pos = None
-        for x, y in self._fringe:
-            prob = self._ask_probability_unsafe(x, y)
+        for (x, y), prob in self._fringe_risk().items():
             if prob < risky_prob:
                 risky_prob = prob
                 next_pos = (x, y)
         return Point(*next_pos)
 
     def update(self):
-        action = next(self._probabilistic_agent())
+        if self._metrics is not None:
+            self._metrics.start_decision()
+        try:
+            action = next(self._probabilistic_agent())
+        finally:
+            if self._metrics is not None:
+                self._metrics.end_decision()
         pos = self.pos
         if action == Direction.UP:
             new_pos = Point(pos.x, pos.y - 1)
@@ -0,0 +1,82 @@
+from dataclasses import dataclass, field
+import time
+from typing import List, Optional
+
+from consts import Property
+from player import Player
+from utils import Point
+from wumpus import WumpusWorld
+
+WON = "won"
+DIED = "died"
+STUCK = "stuck"
+TIMEOUT = "timeout"
+
+
+@dataclass
+class EpisodeResult:
+    outcome: str
+    moves: int
+    final_pos: Point
+    decision_times: List[float] = field(default_factory=list)
+    error: Optional[str] = None
+
+    @property
+    def won(self) -> bool:
+        return self.outcome == WON
+
+
+class Simulator:
+    """Run a player against a world to completion, without any rendering.
+
+    The rules are the ones ``main.py`` applies: the episode is won when the
+    player reaches the gold and lost when it steps on a pit or the wumpus.
+    An agent that raises while deciding is considered stuck, and episodes
+    longer than ``max_moves`` time out.
+    """
+
+    def __init__(
+        self,
+        player: Player,
+        wumpus_world: WumpusWorld,
+        max_moves: Optional[int] = None,
+    ) -> None:
+        self._player = player
+        self._wumpus_world = wumpus_world
+        if max_moves is None:
+            max_moves = 10 * len(wumpus_world._grid) * len(wumpus_world[0])
+        self._max_moves = max_moves
+
+    def _outcome(self) -> Optional[str]:
+        x, y = self._player.pos.x, self._player.pos.y
+        world = self._wumpus_world
+        if world.has(x, y, Property.PIT) or world.has(x, y, Property.WUMPUS):
+            return DIED
+        if world.has(x, y, Property.GOLD):
+            return WON
+        return None
+
+    def run(self) -> EpisodeResult:
+        decision_times = []
+        moves = 0
+        outcome = self._outcome()
+        error = None
+        while outcome is None:
+            if moves >= self._max_moves:
+                outcome = TIMEOUT
+                break
+
+            start = time.perf_counter()
+            try:
+                self._player.update()
+            except Exception as e:
+                outcome = STUCK
+                error = repr(e)
+                break
+            finally:
+                decision_times.append(time.perf_counter() - start)
+            moves += 1
+            outcome = self._outcome()
+
+        pos = self._player.pos
+        return EpisodeResult(outcome, moves, Point(pos.x, pos.y), decision_times, error)
@@ -1,14 +1,27 @@
+import itertools
+
 from inference.bayesian import (
     ConditionalProbabilityTable,
     BayesianNetwork,
     BayesianNetworkNode,
     Variable,
+    elimination_ask,
     enumeration_ask,
+    gibbs_ask,
+    likelihood_weighting,
 )
+from inference.junction_tree import JunctionTree
 from inference.probability import JointDistribution
-from player import ProbabilisticAIPlayer
+from player import LogicAIPlayer, ProbabilisticAIPlayer
+from pylogic.propositional import DpllKB, to_cnf
+from simulation import Simulator
 from utils import Point
-from wumpus import create_wumpus_world1, create_wumpus_world2, WumpusWorldGenerator
+from wumpus import (
+    create_wumpus_world1,
+    create_wumpus_world2,
+    WumpusWorld,
+    WumpusWorldGenerator,
+)
 
 e = {
     "j": True,
@@ -55,6 +68,16 @@ res = enumeration_ask(x, e, bn)
 # Expected result
 # {False: 0.7158281646356071, True: 0.2841718353643929}
 print(res)
+print(elimination_ask(x, e, bn))
+print(likelihood_weighting(x, e, bn, n_samples=100000, seed=0))
+print(gibbs_ask(x, e, bn, n_samples=100000, seed=0))
+
+# Junction tree marginals as evidence arrives, against enumeration
+jt = JunctionTree(bn)
+print(jt.marginal(x.name), enumeration_ask(x, {}, bn))
+for name, value in e.items():
+    jt.observe(name, value)
+    print(jt.marginal(x.name), enumeration_ask(x, jt.evidence, bn))
 
 bn = BayesianNetwork(
     [
@@ -98,6 +121,16 @@ e = {
 
 res = enumeration_ask(x, e, bn)
 print(res)
+print(elimination_ask(x, e, bn))
+print(likelihood_weighting(x, e, bn, n_samples=100000, seed=0))
+print(gibbs_ask(x, e, bn, n_samples=100000, seed=0))
+
+# Junction tree marginals as evidence arrives, against enumeration
+jt = JunctionTree(bn)
+print(jt.marginal(x.name), enumeration_ask(x, {}, bn))
+for name, value in e.items():
+    jt.observe(name, value)
+    print(jt.marginal(x.name), enumeration_ask(x, jt.evidence, bn))
 
 bn = BayesianNetwork(
     [
@@ -132,6 +165,16 @@ e = {
 # Expected result {False: 0.6423123243677238, True: 0.3576876756322762}
 res = enumeration_ask(x, e, bn)
 print(res)
+print(elimination_ask(x, e, bn))
+print(likelihood_weighting(x, e, bn, n_samples=100000, seed=0))
+print(gibbs_ask(x, e, bn, n_samples=100000, seed=0))
+
+# Junction tree marginals as evidence arrives, against enumeration
+jt = JunctionTree(bn)
+print(jt.marginal(x.name), enumeration_ask(x, {}, bn))
+for name, value in e.items():
+    jt.observe(name, value)
+    print(jt.marginal(x.name), enumeration_ask(x, jt.evidence, bn))
 
 
 v1 = Variable("N", [1, 2, 3])
@@ -147,12 +190,48 @@ for events in jpd.all_events([v1, v3, v2], {}):
     print(events)
 
 
+# Fringe risk from both inference engines after the same walk
+risk = {}
+for engine in ("enumeration", "bitmask"):
+    p_agent = ProbabilisticAIPlayer(Point(0, 3), create_wumpus_world1(), engine=engine)
+    for x, y in [(0, 3), (1, 3), (0, 2)]:
+        p_agent._pos = Point(x, y)
+        p_agent._visited[y][x] = True
+        p_agent._perceive()
+    p_agent._fringe = {(x, y) for x, y in p_agent._fringe if not p_agent._visited[y][x]}
+    risk[engine] = p_agent._fringe_risk()
+for pos in sorted(risk["enumeration"]):
+    print(
+        pos,
+        risk["enumeration"][pos],
+        risk["bitmask"][pos],
+        p_agent._ask_probability_unsafe(*pos),
+    )
+
+# Exactly one wumpus encoding, expected consistent with every placement of
+# one wumpus and with no placement of zero or two
+for width, height in [(2, 2), (3, 2), (3, 3)]:
+    world = WumpusWorld([[set() for _ in range(width)] for _ in range(height)])
+    cells = [(i, j) for j in range(height) for i in range(width)]
+    for n_wumpus in (0, 1, 2):
+        consistent = []
+        for placement in itertools.combinations(cells, n_wumpus):
+            kb = DpllKB()
+            for clause in world._exactly_one_wumpus():
+                kb.add(to_cnf(clause))
+            for i, j in cells:
+                negated = (i, j) not in placement
+                kb.add(world.symbols.variable("W", i, j, is_negated=negated))
+            w = world.symbols.variable("W", 0, 0)
+            consistent.append(not (kb.query(w) and kb.query(~w)))
+        print(width, height, n_wumpus, all(consistent), any(consistent))
+
 wumpus_world = create_wumpus_world1()
 wumpus_world = create_wumpus_world2()
 wumpus_world = WumpusWorldGenerator().world
 for row in wumpus_world._grid:
     print(row)
-p_agent = ProbabilisticAIPlayer(Point(0, 3), wumpus_world)
-while True:
-    p_agent.update()
-    input()
+p_agent = ProbabilisticAIPlayer(Point(0, 0), wumpus_world)
+print(Simulator(p_agent, wumpus_world).run())
+l_agent = LogicAIPlayer(Point(0, 0), wumpus_world, exactly_one_wumpus=True)
+print(Simulator(l_agent, wumpus_world).run())
@@ -0,0 +1,112 @@
+"""Evaluate an agent on many seeded worlds using a pool of processes.
+
+Example:
+
+    python tournament.py --agent probabilistic --width 6 --height 6 \
+        --episodes 1000 --workers 8 --seed 42
+"""
+
+import argparse
+from multiprocessing import Pool
+import random
+import sys
+from typing import Dict, Iterator, List, Tuple
+
+from player import LogicAIPlayer, ProbabilisticAIPlayer
+from simulation import EpisodeResult, Simulator
+from utils import Point
+from wumpus import generate_worlds
+
+AGENTS = ("logic", "probabilistic")
+
+
+def run_episode(task: Tuple[int, argparse.Namespace]) -> Tuple[int, EpisodeResult]:
+    """Play episode ``index`` of the tournament.
+
+    The world and the agent random choices are both seeded from the
+    tournament seed and the episode index only, so an episode plays the same
+    whichever worker runs it.
+    """
+    index, args = task
+    world = next(generate_worlds(1, args.seed, args.width, args.height, index))
+    random.seed(f"{args.seed}-{index}")
+    if args.agent == "logic":
+        agent = LogicAIPlayer(Point(0, 0), world)
+    else:
+        agent = ProbabilisticAIPlayer(Point(0, 0), world, engine=args.engine)
+    return index, Simulator(agent, world, args.max_moves).run()
+
+
+def play(args: argparse.Namespace) -> Iterator[Tuple[int, EpisodeResult]]:
+    """Yield episode results as soon as they finish, in no particular order."""
+    tasks = ((i, args) for i in range(args.episodes))
+    if args.workers == 1:
+        yield from map(run_episode, tasks)
+        return
+
+    with Pool(args.workers) as pool:
+        yield from pool.imap_unordered(run_episode, tasks, chunksize=4)
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile of already sorted values."""
+    if not values:
+        return float("nan")
+    rank = max(0, min(len(values) - 1, round(q / 100 * len(values)) - 1))
+    return values[rank]
+
+
+def summarize(results: Dict[int, EpisodeResult]) -> Dict[str, float]:
+    episodes = [results[i] for i in sorted(results)]
+    latencies = sorted(t for r in episodes for t in r.decision_times)
+    summary = {
+        "episodes": len(episodes),
+        "win_rate": sum(r.won for r in episodes) / len(episodes),
+        "avg_moves": sum(r.moves for r in episodes) / len(episodes),
+    }
+    for outcome in sorted({r.outcome for r in episodes}):
+        summary[outcome] = sum(r.outcome == outcome for r in episodes)
+    for q in (50, 90, 99):
+        summary[f"latency_p{q}_ms"] = percentile(latencies, q) * 1000
+    return summary
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--agent", choices=AGENTS, default="probabilistic")
+    parser.add_argument(
+        "--engine",
+        choices=("enumeration", "bitmask"),
+        default="enumeration",
+        help="Inference engine of the probabilistic agent",
+    )
+    parser.add_argument("--width", type=int, default=4)
+    parser.add_argument("--height", type=int, default=4)
+    parser.add_argument("--episodes", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-moves", type=int, default=None)
+    parser.add_argument(
+        "--quiet", action="store_true", help="Only print the final summary"
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str]) -> None:
+    args = parse_args(argv)
+    results = {}
+    for index, result in play(args):
+        results[index] = result
+        if not args.quiet:
+            print(
+                f"[{len(results)}/{args.episodes}] episode {index}: "
+                f"{result.outcome} in {result.moves} moves",
+                flush=True,
+            )
+
+    for key, value in summarize(results).items():
+        print(f"{key}: {value:.4g}" if isinstance(value, float) else f"{key}: {value}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,6 +1,7 @@
+from collections import deque
 from dataclasses import dataclass
 import heapq
-from typing import Callable, Iterator, List, Optional
+from typing import Callable, Iterator, List, Optional, Tuple
 
 from consts import ACTIONS, DOWN, LEFT, RIGHT, UP
 
@@ -151,3 +152,134 @@ def a_star_route(
                 pq.push(child, child.cost + heuristic(problem, child))
 
     return solution
+
+
+class DistanceFieldPlanner:
+    """Shortest routes from a root cell through visited cells.
+
+    Keeps a breadth-first distance field, with the predecessor of every
+    visited cell, rooted at the cell routes start from, and reads routes
+    back from the predecessors. The field is built lazily by the first
+    query after the root moves or a cell becomes visited, so every plan
+    made from a new position costs one breadth-first search over the
+    visited cells, and further queries from the same root reuse it.
+
+    Like ``ShortestPathSearchProblem``, routes run through visited cells
+    except for the goal, which may be an unvisited cell next to them.
+
+    :param visited: Visited flags indexed by row then column, shared with
+        the agent
+    :type visited: List[List[bool]]
+    :param root: Cell routes start from
+    :type root: Point
+    """
+
+    def __init__(self, visited: List[List[bool]], root: Point) -> None:
+        self._visited = visited
+        self._width = len(visited[0])
+        self._height = len(visited)
+        self._root = (root.x, root.y)
+        self._dist: Optional[List[List[Optional[int]]]] = None
+        self._prev: Optional[List[List[Optional[Tuple[int, int]]]]] = None
+
+    @property
+    def root(self) -> Point:
+        return Point(*self._root)
+
+    def _neighbours(self, x: int, y: int) -> Iterator[Tuple[int, int]]:
+        for dx, dy in (LEFT, DOWN, RIGHT, UP):
+            xn, yn = x + dx, y + dy
+            if 0 <= xn < self._width and 0 <= yn < self._height:
+                yield xn, yn
+
+    def _build(self) -> None:
+        if self._dist is not None:
+            return
+        dist: List[List[Optional[int]]] = [
+            [None] * self._width for _ in range(self._height)
+        ]
+        prev: List[List[Optional[Tuple[int, int]]]] = [
+            [None] * self._width for _ in range(self._height)
+        ]
+        x, y = self._root
+        dist[y][x] = 0
+        queue = deque([self._root])
+        while queue:
+            x, y = queue.popleft()
+            d = dist[y][x] + 1
+            for xn, yn in self._neighbours(x, y):
+                if self._visited[yn][xn] and dist[yn][xn] is None:
+                    dist[yn][xn] = d
+                    prev[yn][xn] = (x, y)
+                    queue.append((xn, yn))
+        self._dist, self._prev = dist, prev
+
+    def set_root(self, root: Point) -> None:
+        if (root.x, root.y) != self._root:
+            self._root = (root.x, root.y)
+            self._dist = self._prev = None
+
+    def mark_visited(self, x: int, y: int) -> None:
+        """Flag (x, y) as visited, which may shorten routes."""
+        self._visited[y][x] = True
+        self._dist = self._prev = None
+
+    def _closest_neighbour(self, x: int, y: int) -> Optional[Tuple[int, int]]:
+        best = None
+        for xn, yn in self._neighbours(x, y):
+            d = self._dist[yn][xn]
+            if d is not None and (best is None or d < self._dist[best[1]][best[0]]):
+                best = (xn, yn)
+        return best
+
+    def _entry(self, x: int, y: int) -> Optional[Tuple[int, int]]:
+        """Closest reachable cell to step into (x, y) from, or (x, y) itself."""
+        if self._visited[y][x] or (x, y) == self._root:
+            return (x, y) if self._dist[y][x] is not None else None
+        return self._closest_neighbour(x, y)
+
+    def distance(self, x: int, y: int) -> Optional[int]:
+        """Number of moves from the root to (x, y), None if unreachable."""
+        self._build()
+        entry = self._entry(x, y)
+        if entry is None:
+            return None
+        return self._dist[entry[1]][entry[0]] + ((x, y) != entry)
+
+    def frontier(self) -> Iterator[Tuple[int, int]]:
+        """Unvisited cells one step away from the visited region, nearest first.
+
+        Expands breadth-first from the root through visited cells, so a
+        caller that stops at the first suitable cell only explores the
+        cells closer to the root than it.
+        """
+        seen = {self._root}
+        queue = deque([self._root])
+        while queue:
+            x, y = queue.popleft()
+            for cell in self._neighbours(x, y):
+                if cell in seen:
+                    continue
+                seen.add(cell)
+                if self._visited[cell[1]][cell[0]]:
+                    queue.append(cell)
+                else:
+                    yield cell
+
+    def route(self, goal: Point) -> List[str]:
+        """Actions leading from the root to ``goal``, empty if unreachable."""
+        self._build()
+        cell = (goal.x, goal.y)
+        entry = self._entry(*cell)
+        if entry is None:
+            return []
+        actions = []
+        if entry != cell:
+            actions.append(ACTIONS[cell[0] - entry[0], cell[1] - entry[1]])
+        cell = entry
+        while cell != self._root:
+            prev = self._prev[cell[1]][cell[0]]
+            actions.append(ACTIONS[cell[0] - prev[0], cell[1] - prev[1]])
+            cell = prev
+        actions.reverse()
+        return actions
@@ -1,8 +1,11 @@
-from ast import Tuple
 from collections import defaultdict
+from collections.abc import MutableSet, Sequence
 from functools import reduce
-from random import random, choice
-from typing import Dict, List
+from random import Random
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+
 from consts import Property
 from pylogic.propositional import (
     Variable,
@@ -13,15 +16,77 @@ from utils import Point
 
 MAX_TRAPS_RATIO = 0.2
 TRAPS_INCIDENCE_RATE = 0.15
+# Bump whenever the generated rules change, as it keys cached CNF rule sets
+ENCODING_VERSION = 1
+
+
+def property_flag(prop: Property) -> int:
+    """Bit of a property in the flag encoding of a cell."""
+    return 1 << prop.value
+
+
+# Flag of every property, so hot paths skip the enum value lookup
+PROPERTY_FLAGS = {prop: property_flag(prop) for prop in Property}
+
+
+class SymbolTable:
+    """Dense integer ids for the propositional symbols of a grid.
+
+    Symbol ``kind`` at ``(x, y)``, with kind one of "B" (breeze), "S"
+    (stench), "P" (pit), "W" (wumpus) or "C" (auxiliary counter of the
+    single wumpus encoding), gets id
+    ``1 + (kind_index * map_height + y) * map_width + x``, so ids never
+    collide whatever the grid size is.
+    """
+
+    KINDS = ("B", "S", "P", "W", "C")
+
+    def __init__(self, map_width: int, map_height: int) -> None:
+        self._map_width = map_width
+        self._map_height = map_height
+        self._kind_index = {kind: i for i, kind in enumerate(self.KINDS)}
+
+    def __len__(self) -> int:
+        return len(self.KINDS) * self._map_width * self._map_height
+
+    def id(self, kind: str, x: int, y: int) -> int:
+        cell = y * self._map_width + x
+        return 1 + self._kind_index[kind] * self._map_width * self._map_height + cell
+
+    def variable(self, kind: str, x: int, y: int, is_negated=False) -> Variable:
+        return Variable(self.id(kind, x, y), is_negated=is_negated, truthyness=None)
+
+    def symbol(self, id: int) -> Tuple[str, int, int]:
+        kind, cell = divmod(id - 1, self._map_width * self._map_height)
+        y, x = divmod(cell, self._map_width)
+        return self.KINDS[kind], x, y
 
 
 class WumpusWorld:
     def __init__(self, grid):
         self._grid = grid
+        self._symbols = SymbolTable(len(grid[0]), len(grid))
 
     def __getitem__(self, key):
         return self._grid[key]
 
+    @property
+    def symbols(self) -> SymbolTable:
+        return self._symbols
+
+    def has(self, x: int, y: int, prop: Property) -> bool:
+        """Whether cell (x, y) has a property."""
+        return prop in self._grid[y][x]
+
+    @classmethod
+    def from_flags(cls, flags: np.ndarray) -> "WumpusWorld":
+        """Build a world from a (height, width) array of property bit flags."""
+        grid = [
+            [{prop for prop in Property if cell & property_flag(prop)} for cell in row]
+            for row in flags.tolist()
+        ]
+        return cls(grid)
+
     def _one_wumpus_rule(self) -> Clause:
         """There should exist one wumpus."""
         map_width = len(self._grid[0])
@@ -29,7 +94,7 @@ class WumpusWorld:
         literals: List[Variable] = []
         for i in range(map_width):
             for j in range(map_height):
-                literals.append(Variable(f"W{i}{j}", is_negated=False, truthyness=None))
+                literals.append(self.symbols.variable("W", i, j))
 
         return reduce(lambda x, y: x | y, literals)
 
@@ -42,89 +107,244 @@ class WumpusWorld:
             for i in range(map_width):
                 if i > 0:
                     clauses.append(
-                        Variable(f"W{i}{j}", is_negated=True, truthyness=None)
-                        | Variable(f"W{i - 1}{j}", is_negated=True, truthyness=None)
+                        self.symbols.variable("W", i, j, is_negated=True)
+                        | self.symbols.variable("W", i - 1, j, is_negated=True)
                     )
                 if i < map_width - 1:
                     clauses.append(
-                        Variable(f"W{i}{j}", is_negated=True, truthyness=None)
-                        | Variable(f"W{i + 1}{j}", is_negated=True, truthyness=None)
+                        self.symbols.variable("W", i, j, is_negated=True)
+                        | self.symbols.variable("W", i + 1, j, is_negated=True)
                     )
                 if j > 0:
                     clauses.append(
-                        Variable(f"W{i}{j}", is_negated=True, truthyness=None)
-                        | Variable(f"W{i}{j - 1}", is_negated=True, truthyness=None)
+                        self.symbols.variable("W", i, j, is_negated=True)
+                        | self.symbols.variable("W", i, j - 1, is_negated=True)
                     )
 
                 if j < map_height - 1:
                     if j > 0:
                         clauses.append(
-                            Variable(f"W{i}{j}", is_negated=True, truthyness=None)
-                            | Variable(f"W{i}{j + 1}", is_negated=True, truthyness=None)
+                            self.symbols.variable("W", i, j, is_negated=True)
+                            | self.symbols.variable("W", i, j + 1, is_negated=True)
                         )
         return reduce(lambda x, y: x & y, clauses)
 
+    def _exactly_one_wumpus(self) -> List[Clause]:
+        """There is exactly one wumpus, as a sequential counter encoding.
+
+        Cells are taken in row-major order and the counter symbol ``C`` of
+        cell k holds when a wumpus is at cell k or before it. This needs
+        3n - 3 clauses over 2n - 1 symbols instead of the n^2 / 2 clauses of
+        the pairwise encoding. Clauses are returned separately so they can
+        be added to a KB one at a time.
+        """
+        map_width = len(self._grid[0])
+        map_height = len(self._grid)
+        cells = [(i, j) for j in range(map_height) for i in range(map_width)]
+        clauses = [
+            reduce(
+                lambda x, y: x | y,
+                (self.symbols.variable("W", i, j) for i, j in cells),
+            )
+        ]
+        for k, (i, j) in enumerate(cells[:-1]):
+            # A wumpus here sets the counter
+            clauses.append(
+                self.symbols.variable("W", i, j, is_negated=True)
+                | self.symbols.variable("C", i, j)
+            )
+            if k > 0:
+                prev_i, prev_j = cells[k - 1]
+                # Once set, the counter stays set
+                clauses.append(
+                    self.symbols.variable("C", prev_i, prev_j, is_negated=True)
+                    | self.symbols.variable("C", i, j)
+                )
+        for k in range(1, len(cells)):
+            (i, j), (prev_i, prev_j) = cells[k], cells[k - 1]
+            # No wumpus after the counter was set
+            clauses.append(
+                self.symbols.variable("W", i, j, is_negated=True)
+                | self.symbols.variable("C", prev_i, prev_j, is_negated=True)
+            )
+        return clauses
+
+    def _breeze_stench_rule(
+        self, i: int, j: int
+    ) -> Tuple[BicondClause, BicondClause]:
+        """Breeze and stench rules of a single cell."""
+        map_width = len(self._grid[0])
+        map_height = len(self._grid)
+        b = self.symbols.variable("B", i, j)
+        s = self.symbols.variable("S", i, j)
+        p1 = None
+        w1 = None
+        if i > 0:
+            p1 = self.symbols.variable("P", i - 1, j)
+            w1 = self.symbols.variable("W", i - 1, j)
+
+        p2 = None
+        w2 = None
+        if i < map_width - 1:
+            p2 = self.symbols.variable("P", i + 1, j)
+            w2 = self.symbols.variable("W", i + 1, j)
+        p3 = None
+        w3 = None
+        if j > 0:
+            p3 = self.symbols.variable("P", i, j - 1)
+            w3 = self.symbols.variable("W", i, j - 1)
+        p4 = None
+        w4 = None
+        if j < map_height - 1:
+            p4 = self.symbols.variable("P", i, j + 1)
+            w4 = self.symbols.variable("W", i, j + 1)
+
+        p = reduce(
+            lambda x, y: x | y,
+            filter(lambda x: x is not None, [p1, p2, p3, p4]),
+        )
+        w = reduce(
+            lambda x, y: x | y,
+            filter(lambda x: x is not None, [w1, w2, w3, w4]),
+        )
+        return BicondClause(b, p), BicondClause(s, w)
+
     def _breeze_stench_rules(self):
         map_width = len(self._grid[0])
         map_height = len(self._grid)
         clauses = defaultdict(list)
         for i in range(map_width):
             for j in range(map_height):
-                b = Variable(f"B{i}{j}", False)
-                s = Variable(f"S{i}{j}", False)
-                p1 = None
-                w1 = None
-                if i > 0:
-                    p1 = Variable(f"P{i-1}{j}", False)
-                    w1 = Variable(f"W{i-1}{j}", False)
+                breeze_rule, stench_rule = self._breeze_stench_rule(i, j)
+                clauses["B", Point(i, j)].append(breeze_rule)
+                clauses["S", Point(i, j)].append(stench_rule)
+        return clauses
 
-                p2 = None
-                w2 = None
-                if i < map_width - 1:
-                    p2 = Variable(f"P{i+1}{j}", False)
-                    w2 = Variable(f"W{i+1}{j}", False)
-                p3 = None
-                w3 = None
-                if j > 0:
-                    p3 = Variable(f"P{i}{j-1}", False)
-                    w3 = Variable(f"W{i}{j-1}", False)
-                p4 = None
-                w4 = None
-                if j < map_height - 1:
-                    p4 = Variable(f"P{i}{j + 1}", False)
-                    w4 = Variable(f"W{i}{j + 1}", False)
 
-                p = reduce(
-                    lambda x, y: x | y,
-                    filter(lambda x: x is not None, [p1, p2, p3, p4]),
-                )
-                w = reduce(
-                    lambda x, y: x | y,
-                    filter(lambda x: x is not None, [w1, w2, w3, w4]),
-                )
-                clauses["B", Point(i, j)].append(BicondClause(b, p))
-                clauses["S", Point(i, j)].append(BicondClause(s, w))
-        return clauses
+class _CellFlags(MutableSet):
+    """Set of the properties of one cell, backed by its bit flags."""
+
+    __slots__ = ("_flags", "_y", "_x")
+
+    def __init__(self, flags: np.ndarray, y: int, x: int) -> None:
+        self._flags = flags
+        self._y = y
+        self._x = x
+
+    @classmethod
+    def _from_iterable(cls, it):
+        return set(it)
+
+    def __contains__(self, prop) -> bool:
+        return isinstance(prop, Property) and bool(
+            self._flags.item(self._y, self._x) & PROPERTY_FLAGS[prop]
+        )
+
+    def __iter__(self):
+        value = int(self._flags[self._y, self._x])
+        for prop in Property:
+            if value & property_flag(prop):
+                yield prop
+
+    def __len__(self) -> int:
+        return bin(int(self._flags[self._y, self._x])).count("1")
+
+    def add(self, prop: Property) -> None:
+        self._flags[self._y, self._x] |= property_flag(prop)
+
+    def discard(self, prop: Property) -> None:
+        self._flags[self._y, self._x] &= ~property_flag(prop) & 0xFF
+
+    def __repr__(self) -> str:
+        return repr(set(self))
+
+
+class _FlagsRow(Sequence):
+    def __init__(self, flags: np.ndarray, y: int) -> None:
+        self._flags = flags
+        self._y = y
+
+    def __getitem__(self, x):
+        if isinstance(x, slice):
+            return [self[i] for i in range(*x.indices(len(self)))]
+        if not -len(self) <= x < len(self):
+            raise IndexError("cell index out of range")
+        return _CellFlags(self._flags, self._y, x % len(self))
+
+    def __len__(self) -> int:
+        return self._flags.shape[1]
+
+    def __repr__(self) -> str:
+        return repr(list(self))
+
+
+class BitPackedWumpusWorld(WumpusWorld):
+    """World whose cells are bit flags in a (height, width) uint8 array.
+
+    ``world[y][x]`` behaves like the set of properties of the cell, so it
+    can replace a ``WumpusWorld`` for existing callers, while ``flags``
+    exposes the backing array itself for vectorised code. Changes through
+    either are seen by the other.
+    """
+
+    def __init__(self, flags: np.ndarray) -> None:
+        if flags.ndim != 2 or flags.dtype != np.uint8:
+            raise ValueError("Expected a 2D uint8 array of property flags")
+        self._flags = flags
+        WumpusWorld.__init__(self, [_FlagsRow(flags, y) for y in range(len(flags))])
+
+    @property
+    def flags(self) -> np.ndarray:
+        return self._flags
+
+    def has(self, x: int, y: int, prop: Property) -> bool:
+        # Reads the flags directly, without building a cell view
+        return bool(self._flags.item(y, x) & PROPERTY_FLAGS[prop])
+
+    def mask(self, prop: Property) -> np.ndarray:
+        """Boolean (height, width) array of the cells with a property."""
+        return (self._flags & property_flag(prop)) != 0
+
+    @property
+    def pit_mask(self) -> np.ndarray:
+        return self.mask(Property.PIT)
+
+    @property
+    def breeze_mask(self) -> np.ndarray:
+        return self.mask(Property.BREEZE)
+
+    @property
+    def stench_mask(self) -> np.ndarray:
+        return self.mask(Property.STENCH)
+
+    @property
+    def wumpus_mask(self) -> np.ndarray:
+        return self.mask(Property.WUMPUS)
+
+    @classmethod
+    def from_world(cls, world: WumpusWorld) -> "BitPackedWumpusWorld":
+        flags = np.zeros((len(world._grid), len(world[0])), dtype=np.uint8)
+        for y, row in enumerate(world._grid):
+            for x, cell in enumerate(row):
+                for prop in cell:
+                    flags[y, x] |= property_flag(prop)
+        return cls(flags)
 
 
 class WumpusWorldGenerator:
-    def __init__(self, map_width=4, map_height=4):
+    def __init__(self, map_width=4, map_height=4, seed=None):
         self._map_width = map_width
         self._map_height = map_height
-        self._occupied_spaces = []
+        self._rng = Random(seed)
         self._generate_random_wumpus()
 
 
-    def _spawn_object_coords(self):
+    def _spawn_objects_coords(self, num_objects) -> List[Tuple[int, int]]:
         grid_size = self._map_width * self._map_height
-        max_range = list(range(grid_size)) # Nothing should be on 0,0
-        acceptable_range = list(set(max_range) - set(self._occupied_spaces))
-        # this can technically break if we change max_traps_ratio and no spots are left
-        object_location = choice(acceptable_range)
-        self._occupied_spaces.append(object_location)
-        y = int(object_location / self._map_width)
-        x = object_location - (y * self._map_width)
-        return(x, y)
+        # Nothing should be on 0,0, where the player spawns. This raises if
+        # we change max_traps_ratio and no spots are left
+        locations = self._rng.sample(range(1, grid_size), num_objects)
+        return [divmod(location, self._map_width)[::-1] for location in locations]
 
 
     def _adjacent_coords(self, x, y):
@@ -153,13 +373,6 @@ class WumpusWorldGenerator:
         grid = [
             [set() for _ in range(self._map_width)] for _ in range(self._map_height)
         ]
-        self._occupied_spaces.append(0) # player spawns here
-        wumpus_x, wumpus_y = self._spawn_object_coords()
-        grid[wumpus_y][wumpus_x].add(Property.WUMPUS)
-        for coord in self._adjacent_coords(wumpus_x, wumpus_y):
-            x, y = coord[0], coord[1]
-            grid[y][x].add(Property.STENCH)
-
         max_traps_threshold = int(
             self._map_width * self._map_height * self._max_traps_ratio
         )
@@ -167,19 +380,23 @@ class WumpusWorldGenerator:
             min(
                 max_traps_threshold,
                 sum(
-                    random() > self._traps_incidence_rate
+                    self._rng.random() > self._traps_incidence_rate
                     for _ in range(self._map_width * self._map_height)
                 ),
             )
         )
+        coords = self._spawn_objects_coords(num_traps + 2)
+        (wumpus_x, wumpus_y), (gold_x, gold_y) = coords[0], coords[1]
+        trap_locations = coords[2:]
 
-        trap_locations = []
-        for _ in range(num_traps):
-            trap_x, trap_y = self._spawn_object_coords()
+        grid[wumpus_y][wumpus_x].add(Property.WUMPUS)
+        for coord in self._adjacent_coords(wumpus_x, wumpus_y):
+            x, y = coord[0], coord[1]
+            grid[y][x].add(Property.STENCH)
+
+        for trap_x, trap_y in trap_locations:
             grid[trap_y][trap_x].add(Property.PIT)
-            trap_locations.append([trap_x, trap_y])
 
-        gold_x, gold_y = self._spawn_object_coords()
         grid[gold_y][gold_x].add(Property.GOLD)
 
         for loc in trap_locations:
@@ -191,6 +408,79 @@ class WumpusWorldGenerator:
         self.world = WumpusWorld(grid)
 
 
+def generate_worlds(
+    count: int, seed=None, map_width=4, map_height=4, start=0
+) -> Iterator[WumpusWorld]:
+    """Generate worlds ``start`` to ``start + count - 1`` of a seeded sequence.
+
+    Every world is drawn from its own generator seeded from ``seed`` and its
+    index, so any world can be reproduced without generating the ones
+    before it, and a sequence can be split between processes.
+    """
+    for i in range(start, start + count):
+        world_seed = None if seed is None else f"{seed}-{i}"
+        yield WumpusWorldGenerator(map_width, map_height, seed=world_seed).world
+
+
+def _neighbours_mask(mask: np.ndarray) -> np.ndarray:
+    """Cells next to a set cell of a (batch, height, width) boolean mask."""
+    out = np.zeros_like(mask)
+    out[:, 1:, :] |= mask[:, :-1, :]
+    out[:, :-1, :] |= mask[:, 1:, :]
+    out[:, :, 1:] |= mask[:, :, :-1]
+    out[:, :, :-1] |= mask[:, :, 1:]
+    return out
+
+
+def generate_grids(count: int, seed=None, map_width=4, map_height=4) -> np.ndarray:
+    """Generate a batch of worlds as arrays of property bit flags.
+
+    Worlds follow the same distribution as ``WumpusWorldGenerator``. Cell
+    ``[b, y, x]`` of the result has bit ``property_flag(prop)`` set for every
+    ``Property`` of that cell in world ``b``.
+
+    :param count: Number of worlds
+    :type count: int
+    :param seed: Seed for reproducible batches
+    :param map_width: Width of every world
+    :type map_width: int
+    :param map_height: Height of every world
+    :type map_height: int
+    :return: Array of shape (count, map_height, map_width) and dtype uint8
+    :rtype: np.ndarray
+    """
+    rng = np.random.default_rng(seed)
+    grid_size = map_width * map_height
+    max_traps_threshold = int(grid_size * MAX_TRAPS_RATIO)
+    num_traps = np.minimum(
+        max_traps_threshold, rng.binomial(grid_size, 1 - TRAPS_INCIDENCE_RATE, count)
+    )
+
+    # Random ranks give every world its own sample without replacement of
+    # the cells, with the player cell 0 left out
+    ranks = rng.random((count, grid_size - 1)).argsort(axis=1) + 1
+    locations = ranks[:, : max_traps_threshold + 2]
+    rows = np.arange(count)
+
+    wumpus = np.zeros((count, grid_size), dtype=bool)
+    wumpus[rows, locations[:, 0]] = True
+    gold = np.zeros((count, grid_size), dtype=bool)
+    gold[rows, locations[:, 1]] = True
+    pit = np.zeros((count, grid_size), dtype=bool)
+    is_trap = np.arange(max_traps_threshold) < num_traps[:, None]
+    pit[np.repeat(rows, is_trap.sum(axis=1)), locations[:, 2:][is_trap]] = True
+
+    shape = (count, map_height, map_width)
+    wumpus, gold, pit = wumpus.reshape(shape), gold.reshape(shape), pit.reshape(shape)
+    grids = np.zeros(shape, dtype=np.uint8)
+    grids |= wumpus * np.uint8(property_flag(Property.WUMPUS))
+    grids |= gold * np.uint8(property_flag(Property.GOLD))
+    grids |= pit * np.uint8(property_flag(Property.PIT))
+    grids |= _neighbours_mask(wumpus) * np.uint8(property_flag(Property.STENCH))
+    grids |= _neighbours_mask(pit) * np.uint8(property_flag(Property.BREEZE))
+    return grids
+
+
 def create_wumpus_world1():
     return WumpusWorld(
         [